@@ -3,14 +3,20 @@ File operations script for inserting files from mapping data into PostgreSQL.
 Handles user_id and kb_id mappings and creates folder/file records.
 """
 
-import json
 import logging
 import argparse
-from typing import Dict, Any
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, Tuple
+
+import ijson
+import orjson
+from sqlalchemy import select
 
 from models.folder_file_creator import delete_all_files_and_folders_in_kb, create_folders_batch, create_files_batch
+from models.base import with_db_readonly
 from models.file import FileDB
-from utils.psql_client import db
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,121 +30,119 @@ KB_MAPPINGS = {
     "policy": "kb_01K5RZA4KS04Y7VRGVSYN5EHDE",
 }
 
-# Batch processing configuration
-FOLDER_BATCH_SIZE = 100  # Process folders in batches of 100
-FILE_BATCH_SIZE = 2000    # Process files in batches of 500
-
-def chunk_list(lst, chunk_size):
-    """Split a list into chunks of specified size."""
-    for i in range(0, len(lst), chunk_size):
-        yield lst[i:i + chunk_size]
+# Fields every mapping entry must carry
+REQUIRED_FIELDS = frozenset({"kb", "folder", "file_name", "file_size"})
 
+# Batch processing configuration (folders are created in one batch per KB)
+FILE_BATCH_SIZE = 10000   # Process files in batches of 10000 (one array parameter per column per batch)
 
-def load_mapping_data(file_path: str = "data/mapping_filtered.json") -> Dict[str, Any]:
-    """Load the mapping data from JSON file."""
+def iter_mapping_data(file_path: str = "data/mapping_filtered.json") -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Stream (file_hash, file_info) pairs from the mapping JSON file."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(file_path, 'rb') as f:
+            yield from ijson.kvitems(f, '', use_float=True)
     except FileNotFoundError:
         logger.error(f"Mapping file not found: {file_path}")
         raise
-    except json.JSONDecodeError as e:
+    except ijson.JSONError as e:
         logger.error(f"Error parsing JSON file: {e}")
         raise
 
 
+def process_kb(kb_id: str, data: Dict[str, Any]) -> Tuple[int, int]:
+    """Create folders and files for one KB. Returns (files_created, errors)."""
+    try:
+        logger.info(f"Processing KB {kb_id}: {len(data['folders'])} folders, {len(data['files'])} files")
+
+        # Step 1: Create all folders for this KB in a single batch
+        folder_mapping = create_folders_batch(USER_ID, kb_id, list(data["folders"]))
+
+        logger.info(f"Created total {len(folder_mapping)} folders for KB {kb_id}")
+
+        # Step 2: Prepare file data for batch insertion (one list per column)
+        folder_ids = []
+        file_names = []
+        file_hashes = []
+        file_sizes = []
+        file_errors = 0
+
+        for file_hash, file_name, file_size, folder_name in data["files"]:
+            folder_id = folder_mapping.get(folder_name)
+            if folder_id is None:
+                logger.error(f"Folder {folder_name} not found in mapping")
+                file_errors += 1
+                continue
+
+            folder_ids.append(folder_id)
+            file_names.append(file_name)
+            file_hashes.append(file_hash)
+            file_sizes.append(file_size)
+
+        # Step 3: Create all files for this KB in batches
+        files_created = 0
+        total_files = len(file_hashes)
+        for start in range(0, total_files, FILE_BATCH_SIZE):
+            end = start + FILE_BATCH_SIZE
+            batch_file_ids = create_files_batch(
+                USER_ID, kb_id,
+                folder_ids[start:end], file_names[start:end],
+                file_hashes[start:end], file_sizes[start:end],
+            )
+            files_created += len(batch_file_ids)
+            logger.info(f"Created {len(batch_file_ids)} files in batch for KB {kb_id} (total: {files_created}/{total_files})")
+
+        logger.info(f"Completed KB {kb_id}: {files_created} files created, {file_errors} errors")
+        return files_created, file_errors
+
+    except Exception as e:
+        logger.error(f"Error processing KB {kb_id}: {e}")
+        return 0, len(data["files"])
+
+
 def insert_files_to_postgresql():
     """Main function to insert all files from mapping data into PostgreSQL."""
     logger.info("Starting optimized file insertion process...")
 
-    # Load mapping data
-    mapping_data = load_mapping_data()
-    logger.info(f"Loaded {len(mapping_data)} files from mapping data")
+    # Stream mapping data, organizing it by KB and collecting unique folders
+    kb_data = defaultdict(lambda: {"folders": set(), "files": []})
+    kb_map_get = KB_MAPPINGS.get
+    warn = logger.warning
+    intern = sys.intern
+    mapping_count = 0
+    invalid_count = 0
+    for file_hash, file_info in iter_mapping_data():
+        mapping_count += 1
+        if not REQUIRED_FIELDS <= file_info.keys():
+            logger.error(f"Mapping entry {file_hash} missing fields: {sorted(REQUIRED_FIELDS - file_info.keys())}")
+            invalid_count += 1
+            continue
 
-    # Pre-process data to organize by KB and collect unique folders
-    kb_data = {}
-    for file_hash, file_info in mapping_data.items():
         kb_type = file_info["kb"]
-        if kb_type not in KB_MAPPINGS:
-            logger.warning(f"Unknown KB type: {kb_type} for file: {file_info['file_name']}")
+        kb_id = kb_map_get(kb_type)
+        if kb_id is None:
+            warn(f"Unknown KB type: {kb_type} for file: {file_info['file_name']}")
             continue
 
-        kb_id = KB_MAPPINGS[kb_type]
-        folder_name = file_info["folder"]
-
-        if kb_id not in kb_data:
-            kb_data[kb_id] = {
-                "folders": set(),
-                "files": []
-            }
+        # Folder names repeat across many files; intern them so every entry
+        # shares one string and folder_mapping lookups hit the identity fast path
+        folder_name = intern(file_info["folder"])
+        entry = kb_data[kb_id]
+        entry["folders"].add(folder_name)
+        entry["files"].append((file_hash, file_info["file_name"], file_info["file_size"], folder_name))
 
-        kb_data[kb_id]["folders"].add(folder_name)
-        kb_data[kb_id]["files"].append({
-            "file_hash": file_hash,
-            "file_info": file_info,
-            "folder_name": folder_name
-        })
+    logger.info(f"Loaded {mapping_count} files from mapping data ({invalid_count} invalid)")
 
     # Process each KB
     total_success = 0
-    total_errors = 0
-
-    for kb_id, data in kb_data.items():
-        try:
-            logger.info(f"Processing KB {kb_id}: {len(data['folders'])} folders, {len(data['files'])} files")
-
-            # Step 1: Create all folders for this KB in batches
-            folder_names = list(data["folders"])
-            folder_mapping = {}
-
-            for folder_batch in chunk_list(folder_names, FOLDER_BATCH_SIZE):
-                batch_mapping = create_folders_batch(USER_ID, kb_id, folder_batch)
-                folder_mapping.update(batch_mapping)
-                logger.info(f"Created {len(batch_mapping)} folders in batch for KB {kb_id}")
-
-            logger.info(f"Created total {len(folder_mapping)} folders for KB {kb_id}")
-
-            # Step 2: Prepare file data for batch insertion
-            file_batch_data = []
-            file_errors = 0
-
-            for file_entry in data["files"]:
-                try:
-                    file_info = file_entry["file_info"]
-                    folder_name = file_entry["folder_name"]
-
-                    if folder_name not in folder_mapping:
-                        logger.error(f"Folder {folder_name} not found in mapping")
-                        file_errors += 1
-                        continue
-
-                    file_batch_data.append({
-                        "folder_id": folder_mapping[folder_name],
-                        "file_name": file_info["file_name"],
-                        "file_hash": file_entry["file_hash"],
-                        "file_size": file_info["file_size"],
-                        "status": "completed"
-                    })
-                except Exception as e:
-                    logger.error(f"Error preparing file data: {e}")
-                    file_errors += 1
-
-            # Step 3: Create all files for this KB in batches
-            files_created = 0
-            for file_batch in chunk_list(file_batch_data, FILE_BATCH_SIZE):
-                batch_file_ids = create_files_batch(USER_ID, kb_id, file_batch)
-                files_created += len(batch_file_ids)
-                logger.info(f"Created {len(batch_file_ids)} files in batch for KB {kb_id} (total: {files_created}/{len(file_batch_data)})")
+    total_errors = invalid_count
 
+    # KBs touch disjoint rows, so process them concurrently; each worker
+    # checks out its own connection from the SQLAlchemy pool
+    with ThreadPoolExecutor(max_workers=max(len(kb_data), 1)) as executor:
+        for files_created, file_errors in executor.map(process_kb, kb_data.keys(), kb_data.values()):
             total_success += files_created
             total_errors += file_errors
 
-            logger.info(f"Completed KB {kb_id}: {files_created} files created, {file_errors} errors")
-
-        except Exception as e:
-            logger.error(f"Error processing KB {kb_id}: {e}")
-            total_errors += len(data["files"])
-
     logger.info(f"Optimized file insertion completed. Success: {total_success}, Errors: {total_errors}")
 
     # Log folder creation summary
@@ -179,23 +183,28 @@ def dump_file_mappings(output_file: str):
 
     mappings = {}
 
-    try:
-        with db.get_session_context() as session:
-            # Query all files from database
-            files = session.query(FileDB).all()
-
-            for file_record in files:
-                if file_record.kb_id in KB_MAPPINGS.values():
-                    mappings[file_record.file_hash] = {
-                        "file_id": file_record.file_id,
-                        "kb_id": file_record.kb_id
-                    }
+    def operation(session):
+        # Fetch plain column tuples rather than FileDB instances, and let the
+        # database filter to our KBs
+        rows = session.execute(
+            select(FileDB.file_hash, FileDB.file_id, FileDB.kb_id)
+            .where(FileDB.kb_id.in_(list(KB_MAPPINGS.values())))
+        )
+
+        for file_hash, file_id, kb_id in rows:
+            mappings[file_hash] = {
+                "file_id": file_id,
+                "kb_id": kb_id
+            }
 
-            logger.info(f"Found {len(mappings)} file mappings")
+    try:
+        # Plain read: no transaction needed around the query
+        with_db_readonly(operation, "Error reading file mappings")
+        logger.info(f"Found {len(mappings)} file mappings")
 
         # Write to JSON file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(mappings, f, indent=2, ensure_ascii=False)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(mappings, option=orjson.OPT_INDENT_2))
 
         logger.info(f"Successfully dumped {len(mappings)} file mappings to {output_file}")
 
@@ -1,31 +1,84 @@
 #!/usr/bin/env python3
 import os
+import sys
 import hashlib
-import PyPDF2
+import orjson
+import pypdfium2
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
-def get_file_md5(file_path):
-    """Calculate MD5 hash of a file."""
-    hash_md5 = hashlib.md5()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.file_hash import md5_file
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Sidecar caches (stored in the scanned directory) so reruns skip unchanged files.
+# Entries are keyed by path and only reused while mtime and size still match.
+PAGE_COUNT_CACHE = ".pdf_pages.cache.json"
+FILE_HASH_CACHE = f".file_hash_{'blake3' if blake3 is not None else 'md5'}.cache.json"
+
+def load_cache(cache_path):
+    """Load a sidecar cache of path -> [mtime_ns, size, value]; empty if missing or unreadable."""
+    try:
+        with open(cache_path, "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Ignoring unreadable cache {cache_path}: {e}")
+        return {}
+
+def save_cache(cache_path, cache):
+    """Write a sidecar cache atomically (temp file + rename)."""
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(cache))
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Error writing cache {cache_path}: {e}")
+
+def cache_lookup(cache, path_key, st):
+    """Return the cached value for path_key if its mtime and size still match st, else None."""
+    entry = cache.get(path_key)
+    if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+        return entry[2]
+    return None
+
+def get_file_hash(file_path):
+    """Calculate a content hash of a file (BLAKE3 if installed, otherwise MD5)."""
+    try:
+        if blake3 is not None:
+            return blake3.blake3().update_mmap(file_path).hexdigest()
+        return md5_file(file_path)
+    except Exception as e:
+        print(f"Error calculating hash for {file_path}: {e}")
+        return None
+
+def get_file_head_hash(file_path, head_size=65536):
+    """Calculate MD5 hash of the first head_size bytes of a file."""
     try:
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            return hashlib.md5(f.read(head_size)).digest()
     except Exception as e:
-        print(f"Error calculating MD5 for {file_path}: {e}")
+        print(f"Error reading {file_path}: {e}")
         return None
 
 def cleanup_duplicate_files_keep_level1(directory_path):
-    """Remove duplicate files based on MD5, keeping only files in '国家医疗保障局' directory."""
+    """Remove duplicate files based on content hash, keeping only files in '国家医疗保障局' directory."""
     if not os.path.exists(directory_path):
         print(f"Directory {directory_path} does not exist.")
         return
 
     # Find all files recursively
     all_files = list(Path(directory_path).rglob("*"))
-    # Filter only regular files (not directories)
-    all_files = [f for f in all_files if f.is_file()]
+    # Filter only regular files (not directories), skipping our own cache files
+    cache_names = {PAGE_COUNT_CACHE, FILE_HASH_CACHE}
+    all_files = [f for f in all_files if f.is_file() and f.name not in cache_names]
 
     if not all_files:
         print(f"No files found in {directory_path}")
@@ -33,28 +86,84 @@ def cleanup_duplicate_files_keep_level1(directory_path):
 
     print(f"Found {len(all_files)} files to check for duplicates...")
 
-    # Group files by MD5 hash
-    md5_to_files = {}
     error_count = 0
 
+    # Stage 1: group by size - a file with a unique size cannot have duplicates
+    size_to_files = defaultdict(list)
+    file_stats = {}
     for file_path in all_files:
-        md5_hash = get_file_md5(file_path)
-        if md5_hash is None:
+        try:
+            st = file_path.stat()
+            file_stats[file_path] = st
+            size_to_files[st.st_size].append(file_path)
+        except OSError as e:
+            print(f"Error reading {file_path}: {e}")
             error_count += 1
-            continue
 
-        if md5_hash not in md5_to_files:
-            md5_to_files[md5_hash] = []
-        md5_to_files[md5_hash].append(file_path)
+    candidates = [(size, f) for size, files in size_to_files.items() if len(files) > 1 for f in files]
+
+    # Group files by content hash
+    hash_to_files = {}
+
+    # Hash on threads; blake3, like hashlib (see utils.file_hash), releases the GIL
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # Stage 2: split same-size groups by a hash of the first 64 KiB
+        head_to_files = defaultdict(list)
+        head_hashes = executor.map(get_file_head_hash, [f for _, f in candidates])
+        for (size, file_path), head_hash in zip(candidates, head_hashes):
+            if head_hash is None:
+                error_count += 1
+                continue
+            head_to_files[(size, head_hash)].append(file_path)
+
+        candidate_files = [f for files in head_to_files.values() if len(files) > 1 for f in files]
+        print(f"{len(candidate_files)} files share size and leading bytes, computing full hashes...")
+
+        # Stage 3: full content hash only for the remaining collisions,
+        # reusing hashes cached by previous runs for unchanged files
+        cache_path = os.path.join(directory_path, FILE_HASH_CACHE)
+        old_cache = load_cache(cache_path)
+        hash_cache = {}
+
+        file_hashes = {}
+        to_hash = []
+        for file_path in candidate_files:
+            file_hash = cache_lookup(old_cache, str(file_path), file_stats[file_path])
+            if file_hash is None:
+                to_hash.append(file_path)
+            else:
+                file_hashes[file_path] = file_hash
+        print(f"{len(file_hashes)} hashes reused from cache, hashing {len(to_hash)} files...")
+        file_hashes.update(zip(to_hash, executor.map(get_file_hash, to_hash)))
+
+        for file_path in candidate_files:
+            file_hash = file_hashes[file_path]
+            if file_hash is None:
+                error_count += 1
+                continue
+
+            st = file_stats[file_path]
+            hash_cache[str(file_path)] = [st.st_mtime_ns, st.st_size, file_hash]
+
+            if file_hash not in hash_to_files:
+                hash_to_files[file_hash] = []
+            hash_to_files[file_hash].append(file_path)
+
+    # Keep cached hashes for files still present in this run, drop the rest
+    for file_path, st in file_stats.items():
+        path_key = str(file_path)
+        if path_key not in hash_cache and cache_lookup(old_cache, path_key, st) is not None:
+            hash_cache[path_key] = old_cache[path_key]
+    save_cache(cache_path, hash_cache)
 
     # Process duplicates - keep files in 'level1 国家医疗保障局' directory
     removed_count = 0
-    duplicate_groups = {md5: files for md5, files in md5_to_files.items() if len(files) > 1}
+    duplicate_groups = {file_hash: files for file_hash, files in hash_to_files.items() if len(files) > 1}
 
     print(f"Found {len(duplicate_groups)} groups of duplicate files")
 
-    for md5_hash, duplicate_files in duplicate_groups.items():
-        print(f"\nDuplicate group (MD5: {md5_hash[:8]}...):")
+    for file_hash, duplicate_files in duplicate_groups.items():
+        print(f"\nDuplicate group (hash: {file_hash[:8]}...):")
 
         # Find files in '国家医疗保障局' directory
         level1_files = [f for f in duplicate_files if f.parent.name == "国家医疗保障局"]
@@ -98,9 +207,11 @@ def cleanup_duplicate_files_keep_level1(directory_path):
 def count_pdf_pages(pdf_path):
     """Count the number of pages in a PDF file."""
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            return len(pdf_reader.pages)
+        pdf = pypdfium2.PdfDocument(pdf_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
     except Exception as e:
         print(f"Error reading {pdf_path}: {e}")
         return -1
@@ -122,8 +233,38 @@ def cleanup_zero_page_pdfs(directory_path):
     removed_count = 0
     error_count = 0
 
+    # Reuse page counts cached by previous runs for unchanged files
+    cache_path = os.path.join(directory_path, PAGE_COUNT_CACHE)
+    old_cache = load_cache(cache_path)
+    page_cache = {}
+
+    page_counts = {}
+    file_stats = {}
+    to_count = []
+    for pdf_file in pdf_files:
+        try:
+            st = pdf_file.stat()
+        except OSError as e:
+            print(f"Error reading {pdf_file}: {e}")
+            page_counts[pdf_file] = -1
+            continue
+        file_stats[pdf_file] = st
+        page_count = cache_lookup(old_cache, str(pdf_file), st)
+        if page_count is None:
+            to_count.append(pdf_file)
+        else:
+            page_counts[pdf_file] = page_count
+    print(f"{len(page_counts)} page counts reused from cache, counting {len(to_count)} files...")
+
+    # Page counting is CPU-bound, so spread it over processes; removals stay on the main process
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        page_counts.update(zip(to_count, executor.map(count_pdf_pages, to_count, chunksize=16)))
+
     for pdf_file in pdf_files:
-        page_count = count_pdf_pages(pdf_file)
+        page_count = page_counts[pdf_file]
+        if page_count > 0:
+            st = file_stats[pdf_file]
+            page_cache[str(pdf_file)] = [st.st_mtime_ns, st.st_size, page_count]
 
         if page_count == 0:
             print(f"Removing {pdf_file} (0 pages)")
@@ -138,6 +279,8 @@ def cleanup_zero_page_pdfs(directory_path):
         else:
             print(f"Keeping {pdf_file} ({page_count} pages)")
 
+    save_cache(cache_path, page_cache)
+
     print(f"\nSummary:")
     print(f"- Removed: {removed_count} files")
     print(f"- Errors: {error_count} files")
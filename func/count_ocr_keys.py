@@ -2,25 +2,38 @@
 
 import os
 import sys
-import json
 from datetime import datetime
 
+import orjson
+
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.redis_client import redis_client
 
+# SCAN pattern matching all OCR result keys
+OCR_KEY_PATTERN = 'ocr_results*'
+
+# Number of keys fetched per MGET / deleted per DEL round trip
+REDIS_BATCH_SIZE = 500
+
+def chunk_list(lst, chunk_size):
+    """Split a list into chunks of specified size."""
+    for i in range(0, len(lst), chunk_size):
+        yield lst[i:i + chunk_size]
+
+def get_ocr_keys():
+    """Return all OCR result keys (SCAN, non-blocking), or None if Redis could not be read"""
+    ocr_keys = redis_client.scan_keys(OCR_KEY_PATTERN)
+    if ocr_keys is None:
+        print("Error: Could not retrieve keys from Redis")
+    return ocr_keys
+
 def count_ocr_pages():
     """Count total pages across all Redis keys starting with 'ocr_results'"""
     try:
-        # Get all keys from Redis
-        all_keys = redis_client.list()
-
-        if all_keys is None:
-            print("Error: Could not retrieve keys from Redis")
+        ocr_keys = get_ocr_keys()
+        if ocr_keys is None:
             return -1
 
-        # Filter keys that start with 'ocr_results'
-        ocr_keys = [key for key in all_keys if key.startswith('ocr_results')]
-
         if not ocr_keys:
             print("No OCR keys found")
             return 0
@@ -29,42 +42,43 @@ def count_ocr_pages():
         processed_keys = 0
         deleted_keys = 0
 
-        for key in ocr_keys:
-            try:
-                # Get the value from Redis
-                value = redis_client.get(key)
-                if value is None:
-                    print(f"Warning: Could not retrieve value for key: {key}")
-                    continue
-
-                # Parse JSON content
-                data = json.loads(value)
-
-                # Count pages using len(r["content"])
-                if "text" in data and isinstance(data["text"], list):
-                    page_count = len(data["text"])
-                    total_pages += page_count
-                    processed_keys += 1
-                else:
-                    print(f"Warning: Key {key} does not have valid 'text' array - deleting key")
-                    print(data)
-                    try:
-                        redis_client.delete(key)
-                        deleted_keys += 1
-                        print(f"Deleted key: {key}")
-                    except Exception as delete_error:
-                        print(f"Error deleting key {key}: {delete_error}")
-
-            except json.JSONDecodeError as e:
-                print(f"Warning: Could not parse JSON for key {key}: {e} - deleting key")
+        for key_batch in chunk_list(ocr_keys, REDIS_BATCH_SIZE):
+            # Get the values from Redis in one round trip
+            values = redis_client.mget(key_batch)
+            if values is None:
+                print(f"Warning: Could not retrieve values for {len(key_batch)} keys")
+                continue
+
+            invalid_keys = []
+            for key, value in zip(key_batch, values):
                 try:
-                    redis_client.delete(key)
-                    deleted_keys += 1
-                    print(f"Deleted key with invalid JSON: {key}")
-                except Exception as delete_error:
-                    print(f"Error deleting key {key}: {delete_error}")
-            except Exception as e:
-                print(f"Error processing key {key}: {e}")
+                    if value is None:
+                        print(f"Warning: Could not retrieve value for key: {key}")
+                        continue
+
+                    # Parse JSON content
+                    data = orjson.loads(value)
+
+                    # Count pages using len(r["content"])
+                    if "text" in data and isinstance(data["text"], list):
+                        page_count = len(data["text"])
+                        total_pages += page_count
+                        processed_keys += 1
+                    else:
+                        print(f"Warning: Key {key} does not have valid 'text' array - deleting key")
+                        print(data)
+                        invalid_keys.append(key)
+
+                except orjson.JSONDecodeError as e:
+                    print(f"Warning: Could not parse JSON for key {key}: {e} - deleting key")
+                    invalid_keys.append(key)
+                except Exception as e:
+                    print(f"Error processing key {key}: {e}")
+
+            if invalid_keys:
+                deleted = redis_client.delete_many(invalid_keys)
+                deleted_keys += deleted
+                print(f"Deleted {deleted}/{len(invalid_keys)} invalid keys in batch")
 
         print(f"Total pages across {processed_keys} OCR keys: {total_pages}")
         if deleted_keys > 0:
@@ -78,16 +92,10 @@ def count_ocr_pages():
 def count_ocr_keys():
     """Count Redis keys that start with 'ocr_results'"""
     try:
-        # Get all keys from Redis
-        all_keys = redis_client.list()
-
-        if all_keys is None:
-            print("Error: Could not retrieve keys from Redis")
+        ocr_keys = get_ocr_keys()
+        if ocr_keys is None:
             return -1
 
-        # Filter keys that start with 'ocr_results'
-        ocr_keys = [key for key in all_keys if key.startswith('ocr_results')]
-
         print(f"Number of Redis keys starting with 'ocr_results': {len(ocr_keys)}")
 
         return len(ocr_keys)
@@ -99,16 +107,10 @@ def count_ocr_keys():
 def clear_empty_text_keys():
     """Delete all Redis keys where the text list contains only empty strings"""
     try:
-        # Get all OCR result keys
-        all_keys = redis_client.list()
-
-        if all_keys is None:
-            print("Error: Could not retrieve keys from Redis")
+        ocr_keys = get_ocr_keys()
+        if ocr_keys is None:
             return -1
 
-        # Filter keys that start with 'ocr_results'
-        ocr_keys = [key for key in all_keys if key.startswith('ocr_results')]
-
         if not ocr_keys:
             print("No OCR keys found")
             return 0
@@ -118,33 +120,33 @@ def clear_empty_text_keys():
         empty_text_keys = []
         deleted_keys = 0
 
-        for key in ocr_keys:
-            try:
-                value = redis_client.get(key)
-                if value:
-                    data = json.loads(value)
-                    if 'text' in data and isinstance(data['text'], list):
-                        # Check if all text entries are empty strings
-                        if all(text == "" for text in data['text']):
-                            empty_text_keys.append(key)
-                            print(f"Found empty text key: {key}")
-            except Exception as e:
-                print(f"Error processing key {key}: {e}")
+        for key_batch in chunk_list(ocr_keys, REDIS_BATCH_SIZE):
+            values = redis_client.mget(key_batch)
+            if values is None:
+                print(f"Warning: Could not retrieve values for {len(key_batch)} keys")
+                continue
+
+            for key, value in zip(key_batch, values):
+                try:
+                    if value:
+                        data = orjson.loads(value)
+                        if 'text' in data and isinstance(data['text'], list):
+                            # Check if all text entries are empty strings
+                            if all(text == "" for text in data['text']):
+                                empty_text_keys.append(key)
+                                print(f"Found empty text key: {key}")
+                except Exception as e:
+                    print(f"Error processing key {key}: {e}")
 
         print(f"\nFound {len(empty_text_keys)} keys with all empty text")
 
         if empty_text_keys:
             confirm = input(f"Are you sure you want to delete {len(empty_text_keys)} keys? (y/N): ")
             if confirm.lower() == 'y':
-                for key in empty_text_keys:
-                    try:
-                        if redis_client.delete(key):
-                            deleted_keys += 1
-                            print(f"Deleted key: {key}")
-                        else:
-                            print(f"Failed to delete key: {key}")
-                    except Exception as e:
-                        print(f"Error deleting key {key}: {e}")
+                for key_batch in chunk_list(empty_text_keys, REDIS_BATCH_SIZE):
+                    deleted = redis_client.delete_many(key_batch)
+                    deleted_keys += deleted
+                    print(f"Deleted {deleted}/{len(key_batch)} keys in batch")
 
                 print(f"\nSuccessfully deleted {deleted_keys} keys with empty text")
             else:
@@ -159,18 +161,12 @@ def clear_empty_text_keys():
         return -1
 
 def backup_ocr_keys(output_file=None):
-    """Backup all Redis keys starting with 'ocr_results' to a JSON file"""
+    """Backup all Redis keys starting with 'ocr_results' to an NDJSON file"""
     try:
-        # Get all OCR result keys
-        all_keys = redis_client.list()
-
-        if all_keys is None:
-            print("Error: Could not retrieve keys from Redis")
+        ocr_keys = get_ocr_keys()
+        if ocr_keys is None:
             return -1
 
-        # Filter keys that start with 'ocr_results'
-        ocr_keys = [key for key in all_keys if key.startswith('ocr_results')]
-
         if not ocr_keys:
             print("No OCR keys found")
             return 0
@@ -180,46 +176,62 @@ def backup_ocr_keys(output_file=None):
         # Generate output filename if not provided
         if output_file is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = f"ocr_backup_{timestamp}.json"
+            output_file = f"ocr_backup_{timestamp}.jsonl"
 
-        backup_data = {}
         processed_keys = 0
         failed_keys = 0
+        invalid_keys = 0
 
         print("Starting backup...")
 
-        for i, key in enumerate(ocr_keys, 1):
-            try:
-                value = redis_client.get(key)
-                if value:
-                    # Parse JSON to validate it
-                    data = json.loads(value)
-                    backup_data[key] = data
-                    processed_keys += 1
+        # Stream records to file as NDJSON: one {key: value} object per line.
+        # Values are embedded as raw JSON fragments, so they are not re-parsed,
+        # and only one MGET batch is held in memory at a time.
+        try:
+            with open(output_file, 'wb') as f:
+                for i, key_batch in enumerate(chunk_list(ocr_keys, REDIS_BATCH_SIZE)):
+                    values = redis_client.mget(key_batch)
+                    if values is None:
+                        print(f"Warning: Could not retrieve values for {len(key_batch)} keys")
+                        failed_keys += len(key_batch)
+                        continue
+
+                    lines = []
+                    for key, value in zip(key_batch, values):
+                        if value:
+                            # A fragment is written verbatim, so only a single-line
+                            # JSON object goes in as-is; anything else is parsed and
+                            # re-serialized, or skipped if it isn't a JSON object
+                            if (value.startswith('{') and value.endswith('}')
+                                    and '\n' not in value and '\r' not in value):
+                                record = orjson.Fragment(value)
+                            else:
+                                try:
+                                    record = orjson.loads(value)
+                                except orjson.JSONDecodeError:
+                                    record = None
+                                if not isinstance(record, dict):
+                                    print(f"Warning: Skipping value that is not a JSON object for key: {key}")
+                                    invalid_keys += 1
+                                    continue
+                            lines.append(orjson.dumps({key: record}))
+                            processed_keys += 1
+                        else:
+                            print(f"Warning: Could not retrieve value for key: {key}")
+                            failed_keys += 1
+                    if lines:
+                        f.write(b'\n'.join(lines) + b'\n')
 
                     # Progress indicator
-                    if i % 100 == 0:
-                        print(f"Processed {i}/{len(ocr_keys)} keys...")
-                else:
-                    print(f"Warning: Could not retrieve value for key: {key}")
-                    failed_keys += 1
-            except json.JSONDecodeError as e:
-                print(f"Warning: Invalid JSON for key {key}: {e}")
-                failed_keys += 1
-            except Exception as e:
-                print(f"Error processing key {key}: {e}")
-                failed_keys += 1
-
-        # Write backup to file
-        try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, ensure_ascii=False, indent=2)
+                    print(f"Processed {min((i + 1) * REDIS_BATCH_SIZE, len(ocr_keys))}/{len(ocr_keys)} keys...")
 
             print(f"\nBackup completed successfully!")
             print(f"File: {output_file}")
             print(f"Keys backed up: {processed_keys}")
             if failed_keys > 0:
                 print(f"Failed keys: {failed_keys}")
+            if invalid_keys > 0:
+                print(f"Skipped values that are not JSON objects: {invalid_keys}")
 
             # Show file size
             file_size = os.path.getsize(output_file)
@@ -255,7 +267,7 @@ if __name__ == "__main__":
             print("  (no args): Count OCR keys")
             print("  pages: Count total pages across all OCR keys")
             print("  clear: Delete all keys with empty text arrays")
-            print("  backup [filename]: Backup all OCR keys to JSON file")
-            print("    If no filename provided, uses timestamp: ocr_backup_YYYYMMDD_HHMMSS.json")
+            print("  backup [filename]: Backup all OCR keys to NDJSON file")
+            print("    If no filename provided, uses timestamp: ocr_backup_YYYYMMDD_HHMMSS.jsonl")
     else:
         count_ocr_keys()
\ No newline at end of file
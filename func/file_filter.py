@@ -4,11 +4,13 @@ Filter keys from data/mapping.json that don't exist in JSON files in data/index.
 Reads all index files and extracts all keys, then keeps only the keys that exist in the index files.
 """
 
-import json
 import os
 from pathlib import Path
 from typing import Set, Dict, Any
 
+import ijson
+import orjson
+
 
 def extract_hash_from_key(key: str) -> str:
     """
@@ -38,13 +40,11 @@ def collect_all_keys_from_index(index_dir: str) -> Set[str]:
     for json_file in json_files:
         print(f"Processing {json_file.name}...")
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            # Extract keys and convert them to hashes
-            for key in data.keys():
-                hash_key = extract_hash_from_key(key)
-                all_keys.add(hash_key)
+            # Stream the file's top-level keys; values are never built
+            with open(json_file, 'rb') as f:
+                for prefix, event, value in ijson.parse(f):
+                    if prefix == '' and event == 'map_key':
+                        all_keys.add(extract_hash_from_key(value))
 
         except Exception as e:
             print(f"Error processing {json_file}: {e}")
@@ -63,8 +63,8 @@ def filter_mapping_file(mapping_file: str, index_keys: Set[str], output_file: st
         return {}
 
     print(f"Loading mapping file: {mapping_file}")
-    with open(mapping_file, 'r', encoding='utf-8') as f:
-        mapping_data = json.load(f)
+    with open(mapping_file, 'rb') as f:
+        mapping_data = orjson.loads(f.read())
 
     original_count = len(mapping_data)
     print(f"Original mapping file has {original_count} keys")
@@ -84,8 +84,8 @@ def filter_mapping_file(mapping_file: str, index_keys: Set[str], output_file: st
     # Save filtered data if output file is specified
     if output_file:
         print(f"Saving filtered data to: {output_file}")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(filtered_data, f, ensure_ascii=False, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(filtered_data, option=orjson.OPT_INDENT_2))
         print(f"Filtered mapping saved to {output_file}")
 
     return filtered_data
@@ -1,16 +1,37 @@
-import hashlib
 import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.file_hash import md5_file
 
-def calculate_md5(file_path: str) -> str:
-    """Calculate MD5 hash of a file."""
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+
+def iter_pdf_entries(directory: str):
+    """
+    Yield (os.DirEntry, size in bytes) for all PDF files under directory
+    (suffix case insensitive). Files or folders that vanish or cannot be read
+    during the walk are reported and skipped.
+    """
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file() and entry.name.lower().endswith(".pdf"):
+                        try:
+                            file_size = entry.stat().st_size
+                        except OSError as e:
+                            print(f"Error reading {entry.path}: {e}")
+                            continue
+                        yield entry, file_size
+        except OSError as e:
+            print(f"Error reading {current}: {e}")
 
 
 def traverse_pdfs_to_json(directory: str, output_file: str = None) -> Dict[str, str]:
@@ -32,29 +53,17 @@ def traverse_pdfs_to_json(directory: str, output_file: str = None) -> Dict[str,
     if not directory_path.exists():
         raise ValueError(f"Directory {directory} does not exist")
 
-    # Find all PDF files recursively
-    for pdf_file in directory_path.rglob("*.pdf"):
-        if pdf_file.is_file():
-            try:
-                md5_hash = calculate_md5(str(pdf_file))
-                path_parts = pdf_file.parts
-                kb = path_parts[1] if len(path_parts) > 1 else ""
-                folder = path_parts[2] if len(path_parts) > 2 else ""
+    # Find all PDF files recursively in a single pass (also .PDF, case insensitive)
+    pdf_files = [(Path(entry.path), file_size) for entry, file_size in iter_pdf_entries(directory)]
 
-                pdf_mapping[md5_hash] = {
-                    "file_name": pdf_file.name,
-                    "kb": kb,
-                    "folder": folder,
-                    "file_size": pdf_file.stat().st_size
-                }
-            except Exception as e:
-                print(f"Error processing {pdf_file}: {e}")
+    # Hash files concurrently on threads (see utils.file_hash)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [(pdf_file, file_size, executor.submit(md5_file, str(pdf_file)))
+                   for pdf_file, file_size in pdf_files]
 
-    # Also check for .PDF extension (case insensitive)
-    for pdf_file in directory_path.rglob("*.PDF"):
-        if pdf_file.is_file():
+        for pdf_file, file_size, future in futures:
             try:
-                md5_hash = calculate_md5(str(pdf_file))
+                md5_hash = future.result()
                 path_parts = pdf_file.parts
                 kb = path_parts[1] if len(path_parts) > 1 else ""
                 folder = path_parts[2] if len(path_parts) > 2 else ""
@@ -63,7 +72,7 @@ def traverse_pdfs_to_json(directory: str, output_file: str = None) -> Dict[str,
                     "file_name": pdf_file.name,
                     "kb": kb,
                     "folder": folder,
-                    "file_size": pdf_file.stat().st_size
+                    "file_size": file_size
                 }
             except Exception as e:
                 print(f"Error processing {pdf_file}: {e}")
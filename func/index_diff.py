@@ -1,51 +1,122 @@
 #!/usr/bin/env python3
-import json
+import pickle
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-def find_new_keys(file1_path, file2_path, output_path):
+import ijson
+import orjson
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.file_hash import mapped_file
+
+def load_json_mmap(path):
+    """Parse a JSON file by handing orjson a memory-mapped view instead of a read() copy."""
+    # An empty file maps to b'', which orjson reports as invalid JSON
+    with mapped_file(path) as data:
+        with memoryview(data) as view:
+            return orjson.loads(view)
+
+def load_reference_keys(path):
     """
-    Compare two JSON files and find new key-value pairs in file2 that don't exist in file1.
+    Collect only the top-level keys of a JSON object file with a streaming scan,
+    so memory is O(#keys) and no values are built.
 
-    Args:
-        file1_path: Path to the reference JSON file (0921_processed.json)
-        file2_path: Path to the new JSON file (0922.json)
-        output_path: Path to output the differences (0922_diff.json)
+    The keys are cached in a '<path>.keys' pickle sidecar and reused while it is
+    at least as new as the reference file, so repeated runs skip the scan.
     """
+    sidecar = path + '.keys'
     try:
-        # Load the reference file (0921_processed.json)
-        with open(file1_path, 'r', encoding='utf-8') as f:
-            reference_data = json.load(f)
+        if os.path.getmtime(sidecar) >= os.path.getmtime(path):
+            with open(sidecar, 'rb') as f:
+                return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        print(f"Warning: Ignoring unreadable key cache {sidecar} - {e}")
 
-        # Load the new file (0922.json)
-        with open(file2_path, 'r', encoding='utf-8') as f:
-            new_data = json.load(f)
+    with open(path, 'rb') as f:
+        reference_keys = frozenset(
+            value for prefix, event, value in ijson.parse(f)
+            if prefix == '' and event == 'map_key'
+        )
+
+    try:
+        tmp_path = sidecar + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(reference_keys, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, sidecar)
+    except OSError as e:
+        print(f"Warning: Could not write key cache {sidecar} - {e}")
 
-        # Find new key-value pairs
-        new_kvs = {}
-        for key, value in new_data.items():
-            if key not in reference_data:
-                new_kvs[key] = value
+    return reference_keys
 
-        # Save the differences
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(new_kvs, f, indent=2, ensure_ascii=False)
+def iter_new_items(reference_keys, new_data):
+    """Yield (key, value) pairs of new_data whose key is not in reference_keys, in new_data's order."""
+    # The difference is computed in C; the scan only restores new_data's order
+    # for the (usually few) new keys
+    missing = new_data.keys() - reference_keys
+    if not missing:
+        return
+    for key in new_data:
+        if key in missing:
+            yield key, new_data[key]
 
-        print(f"Found {len(new_kvs)} new key-value pairs")
-        print(f"Differences saved to {output_path}")
+def write_json_object(items, output_path):
+    """
+    Write (key, value) pairs to output_path as one compact JSON object, streaming
+    each pair as it arrives so the whole object is never held in memory.
+
+    Returns:
+        Number of pairs written
+    """
+    count = 0
+    with open(output_path, 'wb') as f:
+        f.write(b'{')
+        for key, value in items:
+            if count:
+                f.write(b',')
+            f.write(orjson.dumps(key) + b':' + orjson.dumps(value))
+            count += 1
+        f.write(b'}')
+    return count
 
-        return len(new_kvs)
+def find_new_keys(file1_path, file2_path, output_path):
+    """
+    Compare two JSON files and find new key-value pairs in file2 that don't exist in file1.
 
+    Args:
+        file1_path: Path to the reference JSON file (0921_processed.json)
+        file2_path: Path to the new JSON file (0922.json)
+        output_path: Path to output the differences (0922_diff.json)
+    """
+    # Load both files concurrently; reading one overlaps with parsing the other
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            reference_future = executor.submit(load_reference_keys, file1_path)
+            new_future = executor.submit(load_json_mmap, file2_path)
+            reference_keys = reference_future.result()
+            new_data = new_future.result()
     except FileNotFoundError as e:
         print(f"Error: File not found - {e}")
         return -1
-    except json.JSONDecodeError as e:
+    except (ijson.JSONError, orjson.JSONDecodeError) as e:
         print(f"Error: Invalid JSON - {e}")
         return -1
-    except Exception as e:
-        print(f"Error: {e}")
+    except OSError as e:
+        print(f"Error: Could not read input - {e}")
         return -1
 
+    try:
+        new_count = write_json_object(iter_new_items(reference_keys, new_data), output_path)
+    except OSError as e:
+        print(f"Error: Could not write {output_path} - {e}")
+        return -1
+
+    sys.stderr.write(f"Found {new_count} new key-value pairs\nDifferences saved to {output_path}\n")
+
+    return new_count
+
 if __name__ == "__main__":
     if len(sys.argv) != 4:
         print("Usage: python index_diff.py <reference_file> <new_file> <output_file>")
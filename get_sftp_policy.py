@@ -14,6 +14,8 @@ Dependencies:
 - paramiko: SFTP client
 - Pillow (PIL): Image processing for PDF merging
 - LibreOffice: Document conversion (must be installed on system)
+- python3-uno (optional): drives one persistent LibreOffice instance instead of
+  spawning soffice per document
 
 Usage:
 python get_sftp_policy.py
@@ -21,170 +23,222 @@ python get_sftp_policy.py
 
 import os
 import json
+import re
+from collections import deque
+from stat import S_ISDIR
 import paramiko
-import subprocess
 import time
 import gc
-import signal
-import psutil
-from PIL import Image
-
-
-def convert_in_background(input_file, output_file):
-    """Start background conversion process using external PDF converter"""
-    subprocess.Popen([
-        'python', 'pdf_converter.py', input_file, output_file
-    ])
+import functools
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from PIL import Image, ImageFile
+
+from utils.convert_cache import ConvertCache
+from utils.libreoffice import convert_with_soffice, kill_orphaned_soffice, libreoffice_server
+from utils.pdf_converter import convert_file_to_pdf
+from utils.sftp_client import SFTPPool, fast_get, fetch_bytes, open_transport
+
+# Number of concurrent SFTP channels used for file transfers
+SFTP_POOL_SIZE = 4
+
+# Folder names containing these markers (repealed / expired) are skipped
+SKIP_RE = re.compile(r'已废止|失效')
+# Attachment types, matched on the file extension
+IMAGE_RE = re.compile(r'\.(?:jpe?g|png|gif|bmp|tiff|webp)$', re.IGNORECASE)
+OFFICE_RE = re.compile(r'\.(?:docx?|pptx?)$', re.IGNORECASE)
+
+# Seconds before a command-line soffice conversion is killed
+LIBREOFFICE_TIMEOUT = 30
+
+# Threads decoding images for merging; Pillow releases the GIL while decoding
+IMAGE_DECODE_WORKERS = os.cpu_count() or 4
+
+# Background TXT/PDF -> PDF conversions run in a bounded pool of worker processes
+# instead of one new interpreter per file. Workers start lazily, after the SFTP,
+# keepalive and watchdog threads are running, so they come from a forkserver
+# rather than fork(): a forked child could inherit a lock held by another thread
+CONVERTER_POOL = ProcessPoolExecutor(
+    max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("forkserver")
+)
+conversion_futures = []
+
+# Attachment images come from our own SFTP source; skip the decompression-bomb check
+Image.MAX_IMAGE_PIXELS = None
+# Keep whatever decodes from a short read instead of dropping the page
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+# Merged pages are downscaled to fit A4 at 300 dpi and stored as JPEG at this quality
+PAGE_MAX_SIZE = (2480, 3508)
+PAGE_JPEG_QUALITY = 85
+
+
+def convert_in_background(input_file, output_file, on_converted=None):
+    """Queue a conversion on the converter pool; returns its Future
+
+    on_converted, if given, is called by wait_for_conversions once the
+    conversion has succeeded
+    """
+    future = CONVERTER_POOL.submit(convert_file_to_pdf, input_file, output_file)
+    conversion_futures.append((future, on_converted))
+    return future
+
+
+def wait_for_conversions():
+    """Block until every queued background conversion has finished, then run their on_converted callbacks"""
+    if not conversion_futures:
+        return
+    print(f"Waiting for {len(conversion_futures)} background conversions...")
+    wait([future for future, _ in conversion_futures])
+    failed = 0
+    for future, on_converted in conversion_futures:
+        if future.exception() is not None or not future.result():
+            failed += 1
+        elif on_converted is not None:
+            on_converted()
+    print(f"Background conversions finished ({failed} failed)")
+    conversion_futures.clear()
 
 
 def convert_with_libreoffice(input_file, output_dir):
     """Convert document to PDF using LibreOffice headless mode"""
-    import signal
-    import psutil
-
-    def kill_hanging_libreoffice():
-        """Kill any hanging LibreOffice processes"""
-        try:
-            for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                if proc.info['name'] and 'soffice' in proc.info['name'].lower():
-                    cmdline = proc.info['cmdline'] or []
-                    if any('--headless' in arg for arg in cmdline):
-                        print(f"  [CLEANUP] Killing hanging LibreOffice process: {proc.info['pid']}")
-                        proc.kill()
-                        proc.wait(timeout=5)
-        except Exception as e:
-            print(f"  [WARNING] Could not clean up LibreOffice processes: {e}")
-
-    try:
-        # Kill any existing hanging LibreOffice processes first
-        kill_hanging_libreoffice()
-
-        # Use a more isolated LibreOffice command with additional flags for better timeout handling
-        cmd = [
-            'soffice',
-            '--headless',
-            '--invisible',
-            '--nodefault',
-            '--nolockcheck',
-            '--nologo',
-            '--norestore',
-            '--convert-to', 'pdf',
-            '--outdir', output_dir,
-            input_file
-        ]
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    output_file = os.path.join(output_dir, f"{base_name}.pdf")
 
+    # Preferred path: convert through the persistent UNO listener
+    if libreoffice_server.available:
         print(f"  [CONVERT] Starting LibreOffice conversion: {os.path.basename(input_file)}")
-
-        # Use shorter timeout and better process handling
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=30,  # Reduced from 60 to 30 seconds
-            preexec_fn=os.setsid if hasattr(os, 'setsid') else None  # Create new process group
-        )
-
-        if result.returncode == 0:
-            # Get the expected output filename
-            base_name = os.path.splitext(os.path.basename(input_file))[0]
-            output_file = os.path.join(output_dir, f"{base_name}.pdf")
-            if os.path.exists(output_file):
-                print(f"  [SUCCESS] LibreOffice conversion completed: {os.path.basename(output_file)}")
-                return output_file
-            else:
-                print(f"  [ERROR] LibreOffice conversion succeeded but output file not found: {base_name}.pdf")
-                return None
-        else:
-            print(f"  [ERROR] LibreOffice conversion failed with code {result.returncode}: {result.stderr.strip()}")
+        if libreoffice_server.convert(input_file, output_file):
+            print(f"  [SUCCESS] LibreOffice conversion completed: {os.path.basename(output_file)}")
+            return output_file
+        # A listener that failed to start falls back to soffice per document
+        if libreoffice_server.available:
             return None
 
-    except subprocess.TimeoutExpired as e:
-        print(f"  [TIMEOUT] LibreOffice conversion timeout for {os.path.basename(input_file)} (30s)")
+    return convert_with_soffice(input_file, output_dir, LIBREOFFICE_TIMEOUT)
 
-        # Kill the timed-out process and any children
-        try:
-            if hasattr(e, 'process') and e.process:
-                # Kill the process group to ensure all child processes are terminated
-                if hasattr(os, 'killpg'):
-                    os.killpg(os.getpgid(e.process.pid), signal.SIGTERM)
-                    time.sleep(2)
-                    os.killpg(os.getpgid(e.process.pid), signal.SIGKILL)
-                else:
-                    e.process.terminate()
-                    time.sleep(2)
-                    e.process.kill()
-        except Exception as kill_error:
-            print(f"  [WARNING] Could not kill timed-out process: {kill_error}")
-
-        # Clean up any remaining LibreOffice processes
-        kill_hanging_libreoffice()
-
-        # Wait a bit before allowing next conversion to avoid interference
-        time.sleep(2)
-        return None
 
-    except Exception as e:
-        print(f"  [ERROR] LibreOffice conversion error for {os.path.basename(input_file)}: {e}")
-        # Clean up any hanging processes on unexpected errors too
-        kill_hanging_libreoffice()
-        return None
+def load_rgb_image(image_file):
+    """Open and decode an image as RGB, downscaled to fit PAGE_MAX_SIZE"""
+    img = Image.open(image_file)
+    try:
+        # Let the JPEG decoder scale down while decoding (no-op for other formats)
+        img.draft('RGB', PAGE_MAX_SIZE)
+        # Convert to RGB if necessary (for PNG with transparency); convert() decodes too
+        rgb = img.convert('RGB') if img.mode != 'RGB' else img.copy()
+    finally:
+        img.close()
+    rgb.thumbnail(PAGE_MAX_SIZE, Image.Resampling.LANCZOS)
+    return rgb
 
 
 def merge_images_to_pdf(image_files, output_pdf_path):
-    """Merge multiple images into a single PDF with each image as one page"""
+    """Merge multiple images (paths or file objects) into a single PDF with each image as one page"""
     if not image_files:
         return False
 
+    images = []
     try:
-        images = []
-        for image_file in image_files:
-            img = Image.open(image_file)
-            # Convert to RGB if necessary (for PNG with transparency)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            images.append(img)
-
-        # Save as PDF with multiple pages
+        # Decode images concurrently; map keeps the page order
+        with ThreadPoolExecutor(max_workers=min(IMAGE_DECODE_WORKERS, len(image_files))) as executor:
+            images = list(executor.map(load_rgb_image, image_files))
+
+        # Save as PDF with multiple pages (RGB pages are embedded as JPEG)
         if images:
-            images[0].save(output_pdf_path, save_all=True, append_images=images[1:])
+            images[0].save(output_pdf_path, save_all=True, append_images=images[1:],
+                           quality=PAGE_JPEG_QUALITY, optimize=True)
             print(f"  [PDF] Merged {len(images)} images into {os.path.basename(output_pdf_path)}")
             return True
     except Exception as e:
         print(f"  [ERROR] Failed to merge images to PDF: {e}")
         return False
+    finally:
+        # Release decoded bitmaps now rather than at the next collection
+        for img in images:
+            img.close()
+
+
+def list_existing(folder_path):
+    """Return the set of entry names in a local folder (empty if it doesn't exist)"""
+    try:
+        with os.scandir(folder_path) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+
+def output_exists(local_folder_path, output_filename, existing=None):
+    """Check for an output file, using the folder's list_existing snapshot when given"""
+    if existing is not None:
+        return output_filename in existing
+    return os.path.exists(os.path.join(local_folder_path, output_filename))
 
 
-def download_and_convert_file_with_soffice(sftp, remote_file_path, local_folder_path, output_filename):
-    """Download a file from SFTP and convert to PDF using LibreOffice"""
+def download_to_temp(pool, remote_file_path, local_folder_path):
+    """Download a file from SFTP to a temp_ file in local_folder_path; returns its path or None"""
+    file_name = os.path.basename(remote_file_path)
+    # Unique per download: files are fetched ahead of conversion, and LibreOffice
+    # writes <temp stem>.pdf next to its input, so X.docx and X.pdf in the same
+    # folder must not share a temp name. The original name stays as the suffix
+    # so the extension still selects the converter.
+    temp_file_path = None
+
+    try:
+        fd, temp_file_path = tempfile.mkstemp(prefix="temp_", suffix=f"_{file_name}", dir=local_folder_path)
+        os.close(fd)
+        with pool.acquire() as sftp:
+            # Download to temporary location with timeout handling
+            try:
+                fast_get(sftp, remote_file_path, temp_file_path)
+                print(f"  [DOWNLOAD] Downloaded {file_name}")
+            except Exception as e:
+                if "timeout" in str(e).lower():
+                    print(f"  [TIMEOUT] Download timeout for {file_name}, retrying...")
+                    fast_get(sftp, remote_file_path, temp_file_path)
+                else:
+                    raise
+        return temp_file_path
+
+    except Exception as e:
+        print(f"  [ERROR] Failed to download {file_name}: {e}")
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.remove(temp_file_path)
+            except:
+                pass
+        return None
+
+
+def download_and_convert_file_with_soffice(pool, remote_file_path, local_folder_path, output_filename, temp_file_path=None, existing=None, on_converted=None):
+    """Download a file from SFTP (unless already downloaded to temp_file_path) and convert to PDF using LibreOffice"""
     file_name = os.path.basename(remote_file_path)
-    temp_file_path = os.path.join(local_folder_path, f"temp_{file_name}")
     final_pdf_path = os.path.join(local_folder_path, output_filename)
 
     # Check if PDF already exists
-    if os.path.exists(final_pdf_path):
+    if output_exists(local_folder_path, output_filename, existing):
         print(f"  [SKIP] PDF already exists: {output_filename}")
+        if temp_file_path and os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
         return True
 
-    try:
-        # Download to temporary location with timeout handling
-        try:
-            sftp.get(remote_file_path, temp_file_path)
-            print(f"  [DOWNLOAD] Downloaded {file_name}")
-        except Exception as e:
-            if "timeout" in str(e).lower():
-                print(f"  [TIMEOUT] Download timeout for {file_name}, retrying...")
-                time.sleep(1)
-                sftp.get(remote_file_path, temp_file_path)
-            else:
-                raise
+    if temp_file_path is None:
+        temp_file_path = download_to_temp(pool, remote_file_path, local_folder_path)
+        if temp_file_path is None:
+            return False
 
+    try:
         # Convert using LibreOffice
         converted_pdf = convert_with_libreoffice(temp_file_path, local_folder_path)
         if converted_pdf and os.path.exists(converted_pdf):
             # Rename to the desired output filename
             if converted_pdf != final_pdf_path:
                 os.rename(converted_pdf, final_pdf_path)
+            if existing is not None:
+                existing.add(output_filename)
             print(f"  [CONVERT] Converted {file_name} -> {output_filename}")
+            if on_converted is not None:
+                on_converted()
             return True
         else:
             print(f"  [ERROR] Failed to convert {file_name} with LibreOffice")
@@ -203,37 +257,33 @@ def download_and_convert_file_with_soffice(sftp, remote_file_path, local_folder_
                 pass
 
 
-def download_and_convert_file(sftp, remote_file_path, local_folder_path, output_filename):
-    """Download a file from SFTP and start background conversion to PDF"""
+def download_and_convert_file(pool, remote_file_path, local_folder_path, output_filename, temp_file_path=None, existing=None, on_converted=None):
+    """Download a file from SFTP (unless already downloaded to temp_file_path) and start background conversion to PDF"""
     file_name = os.path.basename(remote_file_path)
-    temp_file_path = os.path.join(local_folder_path, f"temp_{file_name}")
     final_pdf_path = os.path.join(local_folder_path, output_filename)
 
     # Check if PDF already exists
-    if os.path.exists(final_pdf_path):
+    if output_exists(local_folder_path, output_filename, existing):
         print(f"  [SKIP] PDF already exists: {output_filename}")
+        if temp_file_path and os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
         return True
 
-    try:
-        # Download to temporary location with timeout handling
-        try:
-            sftp.get(remote_file_path, temp_file_path)
-            print(f"  [DOWNLOAD] Downloaded {file_name}")
-        except Exception as e:
-            if "timeout" in str(e).lower():
-                print(f"  [TIMEOUT] Download timeout for {file_name}, retrying...")
-                time.sleep(1)
-                sftp.get(remote_file_path, temp_file_path)
-            else:
-                raise
+    if temp_file_path is None:
+        temp_file_path = download_to_temp(pool, remote_file_path, local_folder_path)
+        if temp_file_path is None:
+            return False
 
+    try:
         # Start background conversion
-        convert_in_background(temp_file_path, final_pdf_path)
+        convert_in_background(temp_file_path, final_pdf_path, on_converted)
+        if existing is not None:
+            existing.add(output_filename)
         print(f"  [BACKGROUND] Started conversion: {file_name} -> {output_filename}")
         return True
 
     except Exception as e:
-        print(f"  [ERROR] Failed to download {file_name}: {e}")
+        print(f"  [ERROR] Failed to start conversion for {file_name}: {e}")
         if os.path.exists(temp_file_path):
             try:
                 os.remove(temp_file_path)
@@ -242,63 +292,71 @@ def download_and_convert_file(sftp, remote_file_path, local_folder_path, output_
         return False
 
 
-def download_and_merge_images(sftp, image_folder_path, local_folder_path, output_filename):
+def fetch_image(pool, remote_file_path):
+    """Download an image into memory with one retry on timeout; returns the buffer or None"""
+    file_name = os.path.basename(remote_file_path)
+    try:
+        with pool.acquire() as sftp:
+            try:
+                buffer = fetch_bytes(sftp, remote_file_path)
+            except Exception as e:
+                if "timeout" in str(e).lower():
+                    print(f"  [TIMEOUT] Image download timeout for {file_name}, retrying...")
+                    buffer = fetch_bytes(sftp, remote_file_path)
+                else:
+                    raise
+        print(f"  [DOWNLOAD] Downloaded image {file_name}")
+        return buffer
+    except Exception as e:
+        print(f"  [ERROR] Failed to download {file_name}: {e}")
+        return None
+
+
+def download_and_merge_images(pool, image_folder_path, local_folder_path, output_filename, existing=None):
     """Download all images from a folder and merge them into a single PDF"""
     final_pdf_path = os.path.join(local_folder_path, output_filename)
 
     # Check if PDF already exists
-    if os.path.exists(final_pdf_path):
+    if output_exists(local_folder_path, output_filename, existing):
         print(f"  [SKIP] PDF already exists: {output_filename}")
         return True
 
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-    temp_image_files = []
+    # (file_name, in-memory buffer) pairs; images never touch the local disk
+    image_buffers = []
 
     try:
-        # Get all image files from the folder with timeout handling
-        try:
-            image_files = sftp.listdir(image_folder_path)
-        except Exception as e:
-            if "timeout" in str(e).lower():
-                print(f"  [TIMEOUT] List timeout for {image_folder_path}, retrying...")
-                time.sleep(1)
-                image_files = sftp.listdir(image_folder_path)
-            else:
-                raise
-
-        for file_name in image_files:
-            file_ext = os.path.splitext(file_name)[1].lower()
+        with pool.acquire() as sftp:
+            # Get all image files from the folder with timeout handling
+            try:
+                image_files = [attr.filename for attr in sftp.listdir_attr(image_folder_path)]
+            except Exception as e:
+                if "timeout" in str(e).lower():
+                    print(f"  [TIMEOUT] List timeout for {image_folder_path}, retrying...")
+                    image_files = [attr.filename for attr in sftp.listdir_attr(image_folder_path)]
+                else:
+                    raise
 
-            # Only process image files
-            if file_ext in image_extensions:
-                file_remote_path = f"{image_folder_path}/{file_name}"
-                temp_file_path = os.path.join(local_folder_path, f"temp_{file_name}")
+        # Only process image files
+        image_names = [name for name in image_files if IMAGE_RE.search(name)]
 
-                try:
-                    # Download with timeout retry
-                    try:
-                        sftp.get(file_remote_path, temp_file_path)
-                        print(f"  [DOWNLOAD] Downloaded image {file_name}")
-                        temp_image_files.append(temp_file_path)
-                    except Exception as e:
-                        if "timeout" in str(e).lower():
-                            print(f"  [TIMEOUT] Image download timeout for {file_name}, retrying...")
-                            time.sleep(1)
-                            sftp.get(file_remote_path, temp_file_path)
-                            temp_image_files.append(temp_file_path)
-                        else:
-                            raise
-                except Exception as e:
-                    print(f"  [ERROR] Failed to download {file_name}: {e}")
+        # Download images concurrently over the SFTP pool
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            buffers = executor.map(
+                lambda file_name: fetch_image(pool, f"{image_folder_path}/{file_name}"),
+                image_names
+            )
+            image_buffers = [(name, buffer) for name, buffer in zip(image_names, buffers) if buffer is not None]
 
         # Merge all images into one PDF
-        if temp_image_files:
-            # Sort files to ensure consistent order
-            temp_image_files.sort()
+        if image_buffers:
+            # Sort by file name to ensure consistent order
+            image_buffers.sort(key=lambda item: item[0])
 
-            success = merge_images_to_pdf(temp_image_files, final_pdf_path)
+            success = merge_images_to_pdf([buffer for _, buffer in image_buffers], final_pdf_path)
             if success:
-                print(f"  [MERGE] Created merged PDF from {len(temp_image_files)} images: {output_filename}")
+                if existing is not None:
+                    existing.add(output_filename)
+                print(f"  [MERGE] Created merged PDF from {len(image_buffers)} images: {output_filename}")
             return success
 
         return False
@@ -308,37 +366,25 @@ def download_and_merge_images(sftp, image_folder_path, local_folder_path, output
         return False
 
     finally:
-        # Clean up temporary image files and force garbage collection
-        for temp_file in temp_image_files:
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-        # Force memory cleanup after processing images
-        gc.collect()
+        # Release the downloaded image bytes; decoded images are closed by merge_images_to_pdf
+        image_buffers.clear()
 
 
-def process_detail_json(sftp, detail_json_path, folder_name, local_folder_path):
+def process_detail_json(sftp, detail_json_path, folder_name, local_folder_path, existing=None):
     """Process detail.json file: extract meta and content, start background conversion to PDF"""
     pdf_file_path = os.path.join(local_folder_path, f"{folder_name}.pdf")
 
     # Check if folder is already processed by checking if main PDF exists
-    if os.path.exists(pdf_file_path):
+    if output_exists(local_folder_path, f"{folder_name}.pdf", existing):
         print(f"  [SKIP] Folder already processed: {folder_name}")
         return True
 
-    temp_json_path = None
     temp_txt_path = None
 
     try:
-        # Download detail.json to temporary location
-        temp_json_path = os.path.join(local_folder_path, "temp_detail.json")
-        sftp.get(detail_json_path, temp_json_path)
-
-        # Read and process JSON
-        with open(temp_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Read detail.json straight into memory; no temp file needed
+        with sftp.open(detail_json_path, 'rb') as f:
+            data = json.loads(f.read())
 
         # Extract meta and content
         meta = data.get('meta', '')
@@ -351,113 +397,162 @@ def process_detail_json(sftp, detail_json_path, folder_name, local_folder_path):
         # Concatenate meta and content
         combined_text = f"{meta_str}\n\n{content_str}" if meta_str and content_str else meta_str or content_str
 
-        # Save as temporary txt file
+        # Save as temporary txt file with a single write of the encoded text
         temp_txt_path = os.path.join(local_folder_path, f"temp_{folder_name}.txt")
-        with open(temp_txt_path, 'w', encoding='utf-8') as f:
-            f.write(combined_text)
+        fd = os.open(temp_txt_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, combined_text.encode('utf-8'))
+        finally:
+            os.close(fd)
 
         # Start background conversion
         convert_in_background(temp_txt_path, pdf_file_path)
+        if existing is not None:
+            existing.add(f"{folder_name}.pdf")
         print(f"  [BACKGROUND] Started conversion: detail.json -> {folder_name}.pdf")
         return True
 
     except Exception as e:
         print(f"  [ERROR] Failed to process detail.json: {e}")
-        # Clean up temp files on failure
-        for temp_file in [temp_json_path, temp_txt_path]:
-            if temp_file and os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-        return False
-
-    finally:
-        # Clean up JSON temp file immediately
-        if temp_json_path and os.path.exists(temp_json_path):
+        # Clean up temp file on failure
+        if temp_txt_path and os.path.exists(temp_txt_path):
             try:
-                os.remove(temp_json_path)
+                os.remove(temp_txt_path)
             except:
                 pass
+        return False
 
 
-def check_attachment_pdfs_exist(local_folder_path, folder_name):
+def check_attachment_pdfs_exist(local_folder_path, folder_name, existing=None):
     """Check if the first attachment PDF already exists for this folder"""
     # Check for pattern: {folder_name}_附件1.pdf
-    attachment1_path = os.path.join(local_folder_path, f"{folder_name}_附件1.pdf")
-    return os.path.exists(attachment1_path)
+    return output_exists(local_folder_path, f"{folder_name}_附件1.pdf", existing)
 
 
-def download_and_rename_attachments(sftp, remote_folder_path, local_folder_path, folder_name):
+def download_and_rename_attachments(sftp, pool, remote_folder_path, local_folder_path, folder_name, existing=None, convert_cache=None):
     """Download files from 'file' and 'image' subfolders, convert to PDF"""
     attachment_counter = 1
 
+    def attach_path(n):
+        """Output (file name, path) of attachment number n of this folder"""
+        name = f"{folder_name}_附件{n}.pdf"
+        return name, os.path.join(local_folder_path, name)
+
     # Process 'file' subfolder - handle images and docx files properly
     file_subfolder_path = f"{remote_folder_path}/file"
     try:
-        files = sftp.listdir(file_subfolder_path)
+        file_attrs = sftp.listdir_attr(file_subfolder_path)
+        files = [attr.filename for attr in file_attrs]
         if files:
-            # Define file type extensions
-            image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-            office_extensions = {'.docx', '.doc', '.pptx', '.ppt'}
-
             # Separate files by type
-            image_files = [f for f in files if os.path.splitext(f)[1].lower() in image_extensions]
-            office_files = [f for f in files if os.path.splitext(f)[1].lower() in office_extensions]
-            other_files = [f for f in files if os.path.splitext(f)[1].lower() not in image_extensions and os.path.splitext(f)[1].lower() not in office_extensions]
+            image_files = []
+            office_files = []
+            other_files = []
+            for f in files:
+                if IMAGE_RE.search(f):
+                    image_files.append(f)
+                elif OFFICE_RE.search(f):
+                    office_files.append(f)
+                else:
+                    other_files.append(f)
 
             # Process image files - merge into one PDF if multiple
             if image_files:
                 if len(image_files) > 1:
                     # Multiple images - merge them
-                    output_filename = f"{folder_name}_附件{attachment_counter}.pdf"
-                    success = download_and_merge_images(sftp, file_subfolder_path, local_folder_path, output_filename)
+                    output_filename, _ = attach_path(attachment_counter)
+                    success = download_and_merge_images(pool, file_subfolder_path, local_folder_path, output_filename, existing)
                     if success:
                         attachment_counter += 1
                 else:
                     # Single image - convert individually
                     for file_name in image_files:
                         file_remote_path = f"{file_subfolder_path}/{file_name}"
-                        output_filename = f"{folder_name}_附件{attachment_counter}.pdf"
+                        output_filename, output_path = attach_path(attachment_counter)
 
                         # For single images, we can use the merge function with one file
-                        temp_files = []
                         try:
-                            temp_file_path = os.path.join(local_folder_path, f"temp_{file_name}")
-                            sftp.get(file_remote_path, temp_file_path)
-                            temp_files.append(temp_file_path)
+                            with pool.acquire() as file_sftp:
+                                image_buffer = fetch_bytes(file_sftp, file_remote_path)
 
-                            success = merge_images_to_pdf(temp_files, os.path.join(local_folder_path, output_filename))
+                            success = merge_images_to_pdf([image_buffer], output_path)
                             if success:
+                                if existing is not None:
+                                    existing.add(output_filename)
                                 attachment_counter += 1
                         except Exception as e:
                             print(f"  [ERROR] Failed to process single image {file_name}: {e}")
-                        finally:
-                            # Clean up temp files
-                            for temp_file in temp_files:
-                                if os.path.exists(temp_file):
-                                    try:
-                                        os.remove(temp_file)
-                                    except:
-                                        pass
-
-            # Process office files individually using LibreOffice
-            for file_name in office_files:
-                file_remote_path = f"{file_subfolder_path}/{file_name}"
-                output_filename = f"{folder_name}_附件{attachment_counter}.pdf"
-
-                success = download_and_convert_file_with_soffice(sftp, file_remote_path, local_folder_path, output_filename)
-                if success:
-                    attachment_counter += 1
-
-            # Process other files using background converter
-            for file_name in other_files:
-                file_remote_path = f"{file_subfolder_path}/{file_name}"
-                output_filename = f"{folder_name}_附件{attachment_counter}.pdf"
-
-                success = download_and_convert_file(sftp, file_remote_path, local_folder_path, output_filename)
-                if success:
-                    attachment_counter += 1
+
+            convert_files = office_files + other_files
+
+            # Sources converted before (same path, size and mtime) are linked from
+            # the cache instead of downloaded and converted again
+            attr_by_name = {attr.filename: attr for attr in file_attrs}
+
+            def source_key(file_name):
+                attr = attr_by_name[file_name]
+                return f"{file_subfolder_path}/{file_name}", attr.st_size, int(attr.st_mtime)
+
+            cached = {}
+            if convert_cache is not None:
+                for file_name in convert_files:
+                    cached_pdf = convert_cache.lookup(*source_key(file_name))
+                    if cached_pdf:
+                        cached[file_name] = cached_pdf
+
+            # Download office and other files concurrently over the SFTP pool while the
+            # loop below converts them in order: file N is converted as soon as it has
+            # arrived, while later files are still downloading. Conversion and numbering
+            # stay sequential so attachments are numbered as before.
+            # Numbers only advance on success, so assuming every earlier file succeeds,
+            # file i becomes attachment first_number + i; files whose output already
+            # exists under that number are not downloaded ahead
+            first_number = attachment_counter
+            with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                downloads = {
+                    file_name: executor.submit(download_to_temp, pool, f"{file_subfolder_path}/{file_name}", local_folder_path)
+                    for offset, file_name in enumerate(convert_files)
+                    if file_name not in cached
+                    and not output_exists(local_folder_path, attach_path(first_number + offset)[0], existing)
+                }
+
+                # Office files are converted individually using LibreOffice,
+                # other files using the background converter
+                for file_names, convert in ((office_files, download_and_convert_file_with_soffice),
+                                            (other_files, download_and_convert_file)):
+                    for file_name in file_names:
+                        file_remote_path = f"{file_subfolder_path}/{file_name}"
+                        output_filename, output_path = attach_path(attachment_counter)
+                        download = downloads.pop(file_name, None)
+
+                        if output_exists(local_folder_path, output_filename, existing):
+                            print(f"  [SKIP] PDF already exists: {output_filename}")
+                            success = True
+                            # Downloaded ahead under a different expected number
+                            temp_file_path = download.result() if download else None
+                            if temp_file_path and os.path.exists(temp_file_path):
+                                os.remove(temp_file_path)
+                        elif file_name in cached:
+                            success = convert_cache.link_cached(cached[file_name], output_path)
+                            if success:
+                                if existing is not None:
+                                    existing.add(output_filename)
+                                print(f"  [CACHE] Reused conversion of {file_name} -> {output_filename}")
+                        else:
+                            # Not downloaded ahead if an earlier failure shifted the numbering
+                            temp_file_path = download.result() if download else download_to_temp(pool, file_remote_path, local_folder_path)
+                            if temp_file_path is None:
+                                continue
+                            # Only record the PDF in the cache once its conversion has
+                            # succeeded; a background conversion may still be running here
+                            on_converted = None
+                            if convert_cache is not None:
+                                on_converted = functools.partial(convert_cache.store, *source_key(file_name), output_path)
+                            success = convert(pool, file_remote_path, local_folder_path, output_filename,
+                                              temp_file_path, existing, on_converted)
+
+                        if success:
+                            attachment_counter += 1
 
     except FileNotFoundError:
         # File subfolder doesn't exist, skip
@@ -469,10 +564,10 @@ def download_and_rename_attachments(sftp, remote_folder_path, local_folder_path,
     image_subfolder_path = f"{remote_folder_path}/image"
     try:
         # Check if image subfolder exists and has files
-        image_files = sftp.listdir(image_subfolder_path)
-        if image_files:
-            output_filename = f"{folder_name}_附件{attachment_counter}.pdf"
-            success = download_and_merge_images(sftp, image_subfolder_path, local_folder_path, output_filename)
+        image_attrs = sftp.listdir_attr(image_subfolder_path)
+        if image_attrs:
+            output_filename, _ = attach_path(attachment_counter)
+            success = download_and_merge_images(pool, image_subfolder_path, local_folder_path, output_filename, existing)
             if success:
                 attachment_counter += 1
 
@@ -483,126 +578,151 @@ def download_and_rename_attachments(sftp, remote_folder_path, local_folder_path,
         print(f"  [ERROR] Error accessing image folder: {e}")
 
 
-def download_sftp_directory_recursive(sftp, remote_path, local_path, folder_name=None, level1_folder=None, is_level1=False, monitor=None):
-    """Recursively download directory contents with special processing for detail.json"""
-    try:
-        # Create local directory only for level 1 folders
-        if is_level1:
-            os.makedirs(local_path, exist_ok=True)
+def download_sftp_directory_tree(sftp, pool, remote_dir, local_dir, monitor=None, convert_cache=None):
+    """Walk the remote tree breadth-first, with special processing for folders containing detail.json"""
+    # (remote_path, local_path, folder_name, level1_folder, is_level1) per directory still to visit
+    pending = deque([(remote_dir, local_dir, None, None, True)])
+    made_dirs = set()
+    # Directories queued but not yet finished, per level 1 folder. The walk is
+    # breadth-first, so a level 1 folder's directories are spread across the
+    # queue; it is done when its count drops to zero
+    unfinished = {}
 
-        # List remote directory contents with timeout handling
+    while pending:
+        remote_path, local_path, folder_name, level1_folder, is_level1 = pending.popleft()
         try:
-            items = sftp.listdir(remote_path)
-        except Exception as e:
-            print(f"  [ERROR] Failed to list directory {remote_path}: {e}")
-            return
+            # Create local directory only for level 1 folders
+            if is_level1 and local_path not in made_dirs:
+                os.makedirs(local_path, exist_ok=True)
+                made_dirs.add(local_path)
+
+            # List remote directory contents with timeout handling
+            # listdir_attr returns names and attributes in one round trip per directory,
+            # so directories are recognised without a stat per entry
+            try:
+                attrs = sftp.listdir_attr(remote_path)
+            except Exception as e:
+                print(f"  [ERROR] Failed to list directory {remote_path}: {e}")
+                continue
 
-        print(f"Processing directory: {remote_path} ({len(items)} items)")
+            items = [attr.filename for attr in attrs]
+            attr_by_name = {attr.filename: attr for attr in attrs}
 
-        # Check if detail.json exists in current directory
-        has_detail_json = 'detail.json' in items
+            print(f"Processing directory: {remote_path} ({len(items)} items)")
 
-        if has_detail_json and folder_name and level1_folder:
-            print(f"  Found detail.json in {folder_name}")
+            # Check if detail.json exists in current directory
+            has_detail_json = 'detail.json' in items
 
-            # Use level 1 folder as the target for saving files
-            # Extract the base local directory and append level1_folder
-            base_local_dir = local_path.split('/ori/')[0] if '/ori/' in local_path else os.path.dirname(local_path)
-            level1_local_path = os.path.join(base_local_dir, 'ori', level1_folder)
-            os.makedirs(level1_local_path, exist_ok=True)
+            if has_detail_json and folder_name and level1_folder:
+                print(f"  Found detail.json in {folder_name}")
 
-            # Quick check: if main PDF exists, skip detail.json processing but still check attachments
-            main_pdf_path = os.path.join(level1_local_path, f"{folder_name}.pdf")
-            main_pdf_exists = os.path.exists(main_pdf_path)
+                # Use level 1 folder as the target for saving files
+                # Extract the base local directory and append level1_folder
+                base_local_dir = local_path.split('/ori/')[0] if '/ori/' in local_path else os.path.dirname(local_path)
+                level1_local_path = os.path.join(base_local_dir, 'ori', level1_folder)
+                if level1_local_path not in made_dirs:
+                    os.makedirs(level1_local_path, exist_ok=True)
+                    made_dirs.add(level1_local_path)
 
-            # Check if any attachment PDFs already exist
-            attachments_exist = check_attachment_pdfs_exist(level1_local_path, folder_name)
+                # One scandir of the target folder answers every existence check below
+                existing = list_existing(level1_local_path)
 
-            if attachments_exist:
-                print(f"  [SKIP] Folder fully processed (main PDF and attachments exist): {folder_name}")
-                return
-            elif main_pdf_exists:
-                print(f"  [SKIP] Main PDF exists, checking for missing attachments: {folder_name}")
+                # Quick check: if main PDF exists, skip detail.json processing but still check attachments
+                main_pdf_exists = f"{folder_name}.pdf" in existing
 
-            # Check connection health before processing
-            if monitor:
-                _, sftp = monitor.check_and_reconnect_if_needed()
+                # Check if any attachment PDFs already exist
+                attachments_exist = check_attachment_pdfs_exist(level1_local_path, folder_name, existing)
 
-            # Process detail.json file and save to level 1 folder (only if main PDF doesn't exist)
-            if not main_pdf_exists:
-                detail_json_path = f"{remote_path}/detail.json"
-                try:
-                    process_detail_json(sftp, detail_json_path, folder_name, level1_local_path)
-                except Exception as e:
-                    print(f"  [ERROR] Failed to process detail.json: {e}")
+                if attachments_exist:
+                    print(f"  [SKIP] Folder fully processed (main PDF and attachments exist): {folder_name}")
+                    continue
+                elif main_pdf_exists:
+                    print(f"  [SKIP] Main PDF exists, checking for missing attachments: {folder_name}")
 
-            # Download and rename attachments (only if no attachments exist)
-            if not attachments_exist:
-                try:
-                    download_and_rename_attachments(sftp, remote_path, level1_local_path, folder_name)
-                except Exception as e:
-                    print(f"  [ERROR] Failed to download attachments: {e}")
+                # Check connection health before processing
+                if monitor:
+                    _, sftp, pool = monitor.check_and_reconnect_if_needed()
 
-            return  # Stop processing this directory further
+                # Process detail.json file and save to level 1 folder (only if main PDF doesn't exist)
+                if not main_pdf_exists:
+                    detail_json_path = f"{remote_path}/detail.json"
+                    try:
+                        process_detail_json(sftp, detail_json_path, folder_name, level1_local_path, existing)
+                    except Exception as e:
+                        print(f"  [ERROR] Failed to process detail.json: {e}")
 
-        # Continue with normal recursive processing for other items
-        for item in items:
-            # Skip folders containing "已废止" in their name
-            if "已废止" in item or "失效" in item:
-                print(f"  [SKIP] Skipping folder with '已废止' or '失效': {item}")
-                continue
+                # Download and rename attachments (only if no attachments exist)
+                if not attachments_exist:
+                    try:
+                        download_and_rename_attachments(sftp, pool, remote_path, level1_local_path, folder_name, existing, convert_cache)
+                    except Exception as e:
+                        print(f"  [ERROR] Failed to download attachments: {e}")
 
-            # Skip specific level 1 folder
-            if is_level1 and item == "浙江医疗保障局":
-                print(f"  [SKIP] Skipping specified folder: {item}")
-                continue
+                continue  # Don't descend into this directory
 
-            # Check connection health periodically
-            if monitor:
-                _, sftp = monitor.check_and_reconnect_if_needed()
+            # Existing PDFs next to level 1 files, read once for the loop below
+            level1_existing = list_existing(local_path) if is_level1 else None
 
-            remote_item_path = f"{remote_path}/{item}"
-            local_item_path = os.path.join(local_path, item)
+            # Queue subdirectories and handle level 1 files
+            for item in items:
+                # Skip folders containing "已废止" in their name
+                if SKIP_RE.search(item):
+                    print(f"  [SKIP] Skipping folder with '已废止' or '失效': {item}")
+                    continue
 
-            try:
-                # Check if item is a directory with timeout handling
-                stat = sftp.stat(remote_item_path)
-                if stat.st_mode & 0o040000:  # Directory
-                    print(f"  [DIR]  {item}")
-
-                    # Determine if this is level 1 and set the level1_folder reference
-                    if is_level1:
-                        # This is a level 1 folder, save its name for future reference
-                        download_sftp_directory_recursive(sftp, remote_item_path, local_item_path, item, item, False, monitor)
+                # Skip specific level 1 folder
+                if is_level1 and item == "浙江医疗保障局":
+                    print(f"  [SKIP] Skipping specified folder: {item}")
+                    continue
+
+                # Check connection health periodically
+                if monitor:
+                    _, sftp, pool = monitor.check_and_reconnect_if_needed()
+
+                remote_item_path = f"{remote_path}/{item}"
+                local_item_path = os.path.join(local_path, item)
+
+                try:
+                    if S_ISDIR(attr_by_name[item].st_mode):
+                        print(f"  [DIR]  {item}")
+
+                        # A child of the root is a level 1 folder; deeper folders inherit its name
+                        child_level1 = item if is_level1 else level1_folder
+                        pending.append((remote_item_path, local_item_path, item, child_level1, False))
+                        unfinished[child_level1] = unfinished.get(child_level1, 0) + 1
                     else:
-                        # Pass down the level1_folder reference
-                        download_sftp_directory_recursive(sftp, remote_item_path, local_item_path, item, level1_folder, False, monitor)
-                else:
-                    # Handle regular files at level 1 (when no detail.json)
-                    if not has_detail_json and is_level1:
-                        # Queue file for conversion using extracted function
-                        file_stem = os.path.splitext(item)[0]
-                        output_filename = f"{file_stem}.pdf"
-                        output_pdf_path = os.path.join(local_path, output_filename)
-
-                        # Check if PDF already exists
-                        if os.path.exists(output_pdf_path):
-                            print(f"  [SKIP] PDF already exists: {output_filename}")
-                            continue
+                        # Handle regular files at level 1 (when no detail.json)
+                        if not has_detail_json and is_level1:
+                            # Queue file for conversion using extracted function
+                            file_stem = os.path.splitext(item)[0]
+                            output_filename = f"{file_stem}.pdf"
+
+                            # Check if PDF already exists
+                            if output_filename in level1_existing:
+                                print(f"  [SKIP] PDF already exists: {output_filename}")
+                                continue
+
+                            print(f"  [FILE] Processing {item}")
+                            try:
+                                success = download_and_convert_file(pool, remote_item_path, local_path, output_filename, existing=level1_existing)
+                                if not success:
+                                    print(f"  [ERROR] Failed to download {item}")
+                            except Exception as e:
+                                print(f"  [ERROR] Failed to download {item}: {e}")
 
-                        print(f"  [FILE] Processing {item}")
-                        try:
-                            success = download_and_convert_file(sftp, remote_item_path, local_path, output_filename)
-                            if not success:
-                                print(f"  [ERROR] Failed to download {item}")
-                        except Exception as e:
-                            print(f"  [ERROR] Failed to download {item}: {e}")
+                except Exception as e:
+                    print(f"  [ERROR] Failed to process {item}: {e}")
 
-            except Exception as e:
-                print(f"  [ERROR] Failed to process {item}: {e}")
+        except Exception as e:
+            print(f"Error processing directory {remote_path}: {e}")
 
-    except Exception as e:
-        print(f"Error processing directory {remote_path}: {e}")
+        finally:
+            # Collect garbage once per level 1 folder rather than after every attachment
+            if level1_folder is not None:
+                unfinished[level1_folder] -= 1
+                if not unfinished[level1_folder]:
+                    del unfinished[level1_folder]
+                    gc.collect()
 
 
 def download_sftp_directory(hostname, username, private_key_path, remote_dir, local_dir):
@@ -610,39 +730,33 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
 
     def create_connection():
         """Create a new SFTP connection with proper timeout settings"""
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        # Load private key
+        private_key = paramiko.RSAKey.from_private_key_file(private_key_path)
 
+        transport = None
         try:
-            # Load private key
-            private_key = paramiko.RSAKey.from_private_key_file(private_key_path)
-
-            # Connect with reasonable timeouts for long operations
-            ssh.connect(
-                hostname=hostname,
-                username=username,
-                pkey=private_key,
-                timeout=60,         # 60s connection timeout
-                banner_timeout=60,  # 60s banner timeout
-                auth_timeout=60     # 60s auth timeout
-            )
+            # Tuned transport (large window, no mid-transfer rekey, keepalives) with 60s connect/banner/auth timeouts
+            transport = open_transport(hostname, username, private_key, timeout=60)
 
             # Open SFTP session with longer timeout for large files
-            sftp = ssh.open_sftp()
+            sftp = paramiko.SFTPClient.from_transport(transport)
             sftp.get_channel().settimeout(300)  # 5 minutes for individual file operations
 
-            return ssh, sftp
+            # Extra SFTP channels on the same transport for concurrent file transfers
+            pool = SFTPPool(transport, SFTP_POOL_SIZE, channel_timeout=300)
+
+            return transport, sftp, pool
 
         except Exception as e:
             print(f"Connection failed: {e}")
-            if 'ssh' in locals():
+            if transport:
                 try:
-                    ssh.close()
+                    transport.close()
                 except:
                     pass
             raise
 
-    def safe_close_connection(ssh, sftp):
+    def safe_close_connection(transport, sftp, pool=None):
         """Safely close SFTP and SSH connections"""
         try:
             if sftp:
@@ -650,9 +764,12 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
         except:
             pass
 
+        if pool:
+            pool.close()
+
         try:
-            if ssh:
-                ssh.close()
+            if transport:
+                transport.close()
         except:
             pass
 
@@ -664,12 +781,18 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
         except:
             return False
 
-    ssh = None
+    transport = None
     sftp = None
+    pool = None
+    convert_cache = None
+
+    # Without the UNO listener every conversion spawns soffice; clear leftovers from earlier runs once
+    if not libreoffice_server.available:
+        kill_orphaned_soffice()
 
     try:
         print(f"Connecting to {hostname} as {username}")
-        ssh, sftp = create_connection()
+        transport, sftp, pool = create_connection()
         print("Connected successfully")
 
         print(f"Starting recursive download from {remote_dir} to {local_dir}")
@@ -678,9 +801,10 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
         try:
             # Add connection health monitoring
             class ConnectionMonitor:
-                def __init__(self, ssh, sftp, create_conn_func):
-                    self.ssh = ssh
+                def __init__(self, transport, sftp, pool, create_conn_func):
+                    self.transport = transport
                     self.sftp = sftp
+                    self.pool = pool
                     self.create_connection = create_conn_func
                     self.last_check = time.time()
                     self.files_since_check = 0
@@ -698,11 +822,11 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
 
                         if not test_connection(self.sftp):
                             print("  [RECONNECT] Connection lost, reconnecting...")
-                            safe_close_connection(self.ssh, self.sftp)
+                            safe_close_connection(self.transport, self.sftp, self.pool)
                             time.sleep(2)
                             gc.collect()
 
-                            self.ssh, self.sftp = self.create_connection()
+                            self.transport, self.sftp, self.pool = self.create_connection()
                             print("  [RECONNECT] Successfully reconnected")
                         else:
                             print("  [HEALTH] Connection is healthy")
@@ -710,17 +834,19 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
                         self.last_check = current_time
                         self.files_since_check = 0
 
-                        return self.ssh, self.sftp
+                        return self.transport, self.sftp, self.pool
 
-                    return self.ssh, self.sftp
+                    return self.transport, self.sftp, self.pool
 
             # Create connection monitor
-            monitor = ConnectionMonitor(ssh, sftp, create_connection)
+            monitor = ConnectionMonitor(transport, sftp, pool, create_connection)
+
+            # Conversion cache lives next to the downloaded tree
+            os.makedirs(local_dir, exist_ok=True)
+            convert_cache = ConvertCache(os.path.join(local_dir, '.convert_cache.db'))
 
             # Start download with the original connection
-            download_sftp_directory_recursive(
-                sftp, remote_dir, local_dir, None, None, True, monitor
-            )
+            download_sftp_directory_tree(sftp, pool, remote_dir, local_dir, monitor, convert_cache)
             print("Download completed successfully")
 
         except Exception as e:
@@ -728,7 +854,17 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
             raise
 
     finally:
-        safe_close_connection(ssh, sftp)
+        # Don't exit while converters are still reading their temp files, and
+        # record the finished PDFs in the cache before it is closed
+        wait_for_conversions()
+
+        if convert_cache is not None:
+            convert_cache.close()
+
+        # The monitor may have reconnected; close whichever connection is current
+        if 'monitor' in locals():
+            transport, sftp, pool = monitor.transport, monitor.sftp, monitor.pool
+        safe_close_connection(transport, sftp, pool)
 
 
 if __name__ == "__main__":
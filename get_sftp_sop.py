@@ -13,129 +13,121 @@ Dependencies:
 - paramiko: SFTP client
 - Pillow (PIL): Image processing for PDF merging
 - LibreOffice: Document conversion (must be installed on system)
+- python3-uno (optional): drives a pool of persistent LibreOffice listeners
+  instead of spawning soffice per document
 
 Usage:
 python get_sftp_sop.py
 """
 
+import atexit
 import os
 import paramiko
-import subprocess
 import time
 import gc
+import threading
+from collections import deque
+from stat import S_ISDIR
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.libreoffice import LibreOfficeServerPool, convert_with_soffice, kill_orphaned_soffice
+from utils.sftp_client import SFTPPool, fast_get, open_transport
+
+# Number of concurrent SFTP channels (and download workers); keep below the
+# server's MaxSessions
+SFTP_POOL_SIZE = 4
+
+# Persistent LibreOffice listeners converting in parallel; each holds a few
+# hundred MB, so the count is capped. Ports start above the policy
+# downloader's listener so both scripts can run at once
+LIBREOFFICE_WORKERS = min(os.cpu_count() or 1, 8)
+# Seconds before a conversion (listener or command line) is killed
+LIBREOFFICE_TIMEOUT = 30
+libreoffice_pool = LibreOfficeServerPool(LIBREOFFICE_WORKERS, base_port=2100,
+                                         convert_timeout=LIBREOFFICE_TIMEOUT)
+atexit.register(libreoffice_pool.stop)
+
+# Command-line soffice instances share one user profile, so without the
+# listeners conversions from the download workers run one at a time
+CONVERT_LOCK = threading.Lock()
+
+# SSH compression costs CPU on every packet and gains little on office files and
+# PDFs, which are already compressed; enable it for links that are badly
+# bandwidth-limited
+SFTP_COMPRESSION = False
+
+# Office documents are converted to PDF; PDFs are downloaded as-is
+OFFICE_EXTENSIONS = frozenset({'.docx', '.doc', '.pptx', '.ppt', '.xlsx', '.xls'})
+SUPPORTED_EXTENSIONS = OFFICE_EXTENSIONS | {'.pdf'}
 
 
 def convert_with_libreoffice(input_file, output_dir):
     """Convert document to PDF using LibreOffice headless mode"""
-    import signal
-    import psutil
-
-    def kill_hanging_libreoffice():
-        """Kill any hanging LibreOffice processes"""
-        try:
-            for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                if proc.info['name'] and 'soffice' in proc.info['name'].lower():
-                    cmdline = proc.info['cmdline'] or []
-                    if any('--headless' in arg for arg in cmdline):
-                        print(f"  [CLEANUP] Killing hanging LibreOffice process: {proc.info['pid']}")
-                        proc.kill()
-                        proc.wait(timeout=5)
-        except Exception as e:
-            print(f"  [WARNING] Could not clean up LibreOffice processes: {e}")
-
-    try:
-        # Kill any existing hanging LibreOffice processes first
-        kill_hanging_libreoffice()
-
-        cmd = [
-            'soffice',
-            '--headless',
-            '--invisible',
-            '--nodefault',
-            '--nolockcheck',
-            '--nologo',
-            '--norestore',
-            '--convert-to', 'pdf',
-            '--outdir', output_dir,
-            input_file
-        ]
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    output_file = os.path.join(output_dir, f"{base_name}.pdf")
 
+    # Preferred path: convert through a persistent UNO listener
+    if libreoffice_pool.available:
         print(f"  [CONVERT] Starting LibreOffice conversion: {os.path.basename(input_file)}")
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=30,
-            preexec_fn=os.setsid if hasattr(os, 'setsid') else None
-        )
-
-        if result.returncode == 0:
-            base_name = os.path.splitext(os.path.basename(input_file))[0]
-            output_file = os.path.join(output_dir, f"{base_name}.pdf")
-            if os.path.exists(output_file):
-                print(f"  [SUCCESS] LibreOffice conversion completed: {os.path.basename(output_file)}")
-                return output_file
-            else:
-                print(f"  [ERROR] LibreOffice conversion succeeded but output file not found: {base_name}.pdf")
-                return None
-        else:
-            print(f"  [ERROR] LibreOffice conversion failed with code {result.returncode}: {result.stderr.strip()}")
+        if libreoffice_pool.convert(input_file, output_file):
+            print(f"  [SUCCESS] LibreOffice conversion completed: {os.path.basename(output_file)}")
+            return output_file
+        # Listeners that failed to start fall back to soffice per document
+        if libreoffice_pool.available:
             return None
 
-    except subprocess.TimeoutExpired as e:
-        print(f"  [TIMEOUT] LibreOffice conversion timeout for {os.path.basename(input_file)} (30s)")
+    # One command-line soffice at a time (see CONVERT_LOCK)
+    with CONVERT_LOCK:
+        return convert_with_soffice(input_file, output_dir, LIBREOFFICE_TIMEOUT)
 
-        try:
-            if hasattr(e, 'process') and e.process:
-                if hasattr(os, 'killpg'):
-                    os.killpg(os.getpgid(e.process.pid), signal.SIGTERM)
-                    time.sleep(2)
-                    os.killpg(os.getpgid(e.process.pid), signal.SIGKILL)
-                else:
-                    e.process.terminate()
-                    time.sleep(2)
-                    e.process.kill()
-        except Exception as kill_error:
-            print(f"  [WARNING] Could not kill timed-out process: {kill_error}")
-
-        kill_hanging_libreoffice()
-        time.sleep(2)
-        return None
-
-    except Exception as e:
-        print(f"  [ERROR] LibreOffice conversion error for {os.path.basename(input_file)}: {e}")
-        kill_hanging_libreoffice()
-        return None
 
+def transfer(get_pool, fetch):
+    """
+    Run fetch(sftp) on a client borrowed from the current SFTP pool.
 
+    get_pool(recheck) returns the pool to use when the transfer starts, so
+    queued work picks up a reconnected pool. If the connection fails the pool
+    is fetched again with recheck=True, which checks the connection health
+    (reconnecting if needed), and the transfer is retried once.
+    """
+    for attempt in range(2):
+        pool = get_pool(attempt > 0)
+        try:
+            with pool.acquire() as sftp:
+                return fetch(sftp)
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            if attempt:
+                raise
+            print(f"  [RETRY] Transfer failed ({e}), retrying on a checked connection...")
 
 
-def download_and_convert_file(sftp, remote_file_path, local_folder_path, output_filename):
+def download_and_convert_file(get_pool, remote_file_path, local_folder_path, output_filename):
     """Download a file from SFTP and convert to PDF using LibreOffice"""
     file_name = os.path.basename(remote_file_path)
-    temp_file_path = os.path.join(local_folder_path, f"temp_{file_name}")
+    # Name the temp file after the (flattened, unique) output so concurrent
+    # downloads of same-named files from different folders don't collide
+    temp_file_path = os.path.join(
+        local_folder_path, f"temp_{os.path.splitext(output_filename)[0]}{os.path.splitext(file_name)[1]}"
+    )
     final_pdf_path = os.path.join(local_folder_path, output_filename)
 
-    # Check if PDF already exists
-    if os.path.exists(final_pdf_path):
-        print(f"  [SKIP] PDF already exists: {output_filename}")
-        return True
-
-    try:
-        # Download to temporary location
+    def fetch(sftp):
         try:
-            sftp.get(remote_file_path, temp_file_path)
-            print(f"  [DOWNLOAD] Downloaded {file_name}")
+            fast_get(sftp, remote_file_path, temp_file_path)
         except Exception as e:
             if "timeout" in str(e).lower():
                 print(f"  [TIMEOUT] Download timeout for {file_name}, retrying...")
                 time.sleep(1)
-                sftp.get(remote_file_path, temp_file_path)
+                fast_get(sftp, remote_file_path, temp_file_path)
             else:
                 raise
 
-        # Convert using LibreOffice
+    try:
+        # Download to temporary location
+        transfer(get_pool, fetch)
+        print(f"  [DOWNLOAD] Downloaded {file_name}")
+
+        # Convert using LibreOffice (limits its own concurrency)
         converted_pdf = convert_with_libreoffice(temp_file_path, local_folder_path)
         if converted_pdf and os.path.exists(converted_pdf):
             if converted_pdf != final_pdf_path:
@@ -161,104 +153,125 @@ def download_and_convert_file(sftp, remote_file_path, local_folder_path, output_
 
 
 
-def download_sftp_directory_recursive(sftp, remote_path, local_path, level1_folder=None, is_level1=False, monitor=None, path_prefix=""):
-    """Recursively download directory contents with office file conversion"""
+def is_up_to_date(local_path, entry, same_size=False):
+    """
+    True if local_path exists and is no older than the remote entry's mtime
+    (and, with same_size, has the same size), so a rerun can skip it
+    """
     try:
-        # Create local directory only for level 1
-        if is_level1:
-            os.makedirs(local_path, exist_ok=True)
+        local_stat = os.stat(local_path)
+    except FileNotFoundError:
+        return False
+    if same_size and local_stat.st_size != entry.st_size:
+        return False
+    return entry.st_mtime is None or int(local_stat.st_mtime) >= entry.st_mtime
 
-        # List remote directory contents
+
+def download_pdf(get_pool, remote_file_path, local_file_path, file_size=None, remote_mtime=None):
+    """Download a PDF as-is from SFTP, stamping it with the remote mtime"""
+    try:
+        transfer(get_pool, lambda sftp: fast_get(sftp, remote_file_path, local_file_path, file_size))
+        if remote_mtime is not None:
+            os.utime(local_file_path, (remote_mtime, remote_mtime))
+        print(f"  [DOWNLOAD] Downloaded {os.path.basename(local_file_path)}")
+    except Exception as e:
+        print(f"  [ERROR] Failed to download {os.path.basename(remote_file_path)}: {e}")
+
+
+def download_sftp_directory_tree(sftp, pool, executor, remote_dir, local_dir, monitor=None):
+    """
+    Walk the remote tree breadth-first on the control connection; downloads and
+    office file conversions are handed to executor and use connections from pool
+    (from the monitor's current pool when a monitor is given)
+    """
+    # Queued tasks look the pool up when they run, so a reconnect between
+    # queuing and running does not leave them holding a closed pool
+    if monitor:
+        get_pool = monitor.current_pool
+    else:
+        get_pool = lambda recheck=False: pool
+
+    # Local files directly under the root stay where they are
+    os.makedirs(local_dir, exist_ok=True)
+
+    # (remote_path, local_path, prefix_parts, is_level1) per directory still to visit.
+    # prefix_parts are the folders below the level 1 folder; they are joined
+    # into the flattened filename prefix only when a file is emitted
+    pending = deque([(remote_dir, local_dir, (), True)])
+
+    while pending:
+        remote_path, local_path, prefix_parts, is_level1 = pending.popleft()
         try:
-            items = sftp.listdir(remote_path)
-        except Exception as e:
-            print(f"  [ERROR] Failed to list directory {remote_path}: {e}")
-            return
+            # List remote directory contents; listdir_attr returns names and
+            # attributes in one round trip, so entries need no separate stat
+            try:
+                entries = sftp.listdir_attr(remote_path)
+            except Exception as e:
+                print(f"  [ERROR] Failed to list directory {remote_path}: {e}")
+                continue
 
-        print(f"Processing directory: {remote_path} ({len(items)} items)")
+            print(f"Processing directory: {remote_path} ({len(entries)} items)")
 
-        # Define file type extensions
-        office_extensions = {'.docx', '.doc', '.pptx', '.ppt', '.xlsx', '.xls'}
-        pdf_extensions = {'.pdf'}
+            path_prefix = "_".join(prefix_parts) + "_" if prefix_parts else ""
 
-        for item in items:
-            # Check connection health periodically
-            if monitor:
-                _, sftp = monitor.check_and_reconnect_if_needed()
+            for entry in entries:
+                item = entry.filename
 
-            remote_item_path = f"{remote_path}/{item}"
+                # Check connection health periodically
+                if monitor:
+                    _, sftp, _ = monitor.check_and_reconnect_if_needed()
 
-            try:
-                # Check if item is a directory
-                stat = sftp.stat(remote_item_path)
-                if stat.st_mode & 0o040000:  # Directory
-                    print(f"  [DIR]  {item}")
-
-                    if is_level1:
-                        # This is a level 1 folder - create it and process contents
-                        level1_local_path = os.path.join(local_path, item)
-                        os.makedirs(level1_local_path, exist_ok=True)
-                        download_sftp_directory_recursive(sftp, remote_item_path, level1_local_path, item, False, monitor, "")
-                    else:
-                        # Deeper level - append folder name to path prefix
-                        new_prefix = f"{path_prefix}{item}_" if path_prefix else f"{item}_"
-                        download_sftp_directory_recursive(sftp, remote_item_path, local_path, level1_folder, False, monitor, new_prefix)
-                else:
-                    # Handle regular files
-                    file_ext = os.path.splitext(item)[1].lower()
-                    file_stem = os.path.splitext(item)[0]
-
-                    # Apply path prefix to filename
-                    final_filename = f"{path_prefix}{file_stem}" if path_prefix else file_stem
-
-                    if file_ext in office_extensions:
-                        # Convert office files to PDF
-                        output_filename = f"{final_filename}.pdf"
-                        output_pdf_path = os.path.join(local_path, output_filename)
-
-                        # Ensure local directory exists
-                        os.makedirs(local_path, exist_ok=True)
-
-                        if os.path.exists(output_pdf_path):
-                            print(f"  [SKIP] PDF already exists: {output_filename}")
-                            continue
-
-                        print(f"  [OFFICE] Processing {item} -> {output_filename}")
-                        try:
-                            success = download_and_convert_file(sftp, remote_item_path, local_path, output_filename)
-                            if not success:
-                                print(f"  [ERROR] Failed to convert {item}")
-                        except Exception as e:
-                            print(f"  [ERROR] Failed to process {item}: {e}")
-
-                    elif file_ext in pdf_extensions:
-                        # Download PDF files directly with flattened name
-                        output_filename = f"{final_filename}.pdf"
-                        local_item_path = os.path.join(local_path, output_filename)
-
-                        # Ensure local directory exists
-                        os.makedirs(local_path, exist_ok=True)
-
-                        if os.path.exists(local_item_path):
-                            print(f"  [SKIP] PDF already exists: {output_filename}")
-                            continue
-
-                        print(f"  [PDF] Downloading {item} -> {output_filename}")
-                        try:
-                            sftp.get(remote_item_path, local_item_path)
-                            print(f"  [DOWNLOAD] Downloaded {output_filename}")
-                        except Exception as e:
-                            print(f"  [ERROR] Failed to download {item}: {e}")
+                remote_item_path = f"{remote_path}/{item}"
 
-                    else:
+                try:
+                    if S_ISDIR(entry.st_mode):
+                        print(f"  [DIR]  {item}")
+
+                        if is_level1:
+                            # This is a level 1 folder - create it and process contents
+                            level1_local_path = os.path.join(local_path, item)
+                            os.makedirs(level1_local_path, exist_ok=True)
+                            pending.append((remote_item_path, level1_local_path, (), False))
+                        else:
+                            # Deeper level - files are flattened into the level 1 folder
+                            # with this folder's name added to their prefix
+                            pending.append((remote_item_path, local_path, prefix_parts + (item,), False))
+                        continue
+
+                    # Handle regular files; local_path already exists (created with
+                    # its level 1 folder)
+                    file_stem, file_ext = os.path.splitext(item)
+                    file_ext = file_ext.lower()
+                    if file_ext not in SUPPORTED_EXTENSIONS:
                         # Ignore other file types
                         print(f"  [IGNORE] Skipping {item} (unsupported file type)")
+                        continue
+
+                    # Apply path prefix to filename; both office files and PDFs end up as a flattened PDF
+                    output_filename = f"{path_prefix}{file_stem}.pdf"
+                    output_pdf_path = os.path.join(local_path, output_filename)
+
+                    # Incremental sync: a downloaded PDF must match the remote size
+                    # (catching partial downloads); a converted PDF only has to be
+                    # newer than its source
+                    if is_up_to_date(output_pdf_path, entry, same_size=file_ext == '.pdf'):
+                        print(f"  [SKIP] PDF is up to date: {output_filename}")
+                        continue
+
+                    if file_ext == '.pdf':
+                        # Download PDF files directly
+                        print(f"  [PDF] Queued {item} -> {output_filename}")
+                        executor.submit(download_pdf, get_pool, remote_item_path, output_pdf_path, entry.st_size, entry.st_mtime)
+                    else:
+                        # Convert office files to PDF
+                        print(f"  [OFFICE] Queued {item} -> {output_filename}")
+                        executor.submit(download_and_convert_file, get_pool, remote_item_path, local_path, output_filename)
 
-            except Exception as e:
-                print(f"  [ERROR] Failed to process {item}: {e}")
+                except Exception as e:
+                    print(f"  [ERROR] Failed to process {item}: {e}")
 
-    except Exception as e:
-        print(f"Error processing directory {remote_path}: {e}")
+        except Exception as e:
+            print(f"Error processing directory {remote_path}: {e}")
 
 
 def download_sftp_directory(hostname, username, private_key_path, remote_dir, local_dir):
@@ -266,39 +279,31 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
 
     def create_connection():
         """Create a new SFTP connection with proper timeout settings"""
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        # Load private key
+        private_key = paramiko.RSAKey.from_private_key_file(private_key_path)
 
+        transport = None
         try:
-            # Load private key
-            private_key = paramiko.RSAKey.from_private_key_file(private_key_path)
-
-            # Connect with reasonable timeouts
-            ssh.connect(
-                hostname=hostname,
-                username=username,
-                pkey=private_key,
-                timeout=60,
-                banner_timeout=60,
-                auth_timeout=60
-            )
-
-            # Open SFTP session
-            sftp = ssh.open_sftp()
+            # Tuned transport (large window, no mid-transfer rekey) with 60s connect/banner/auth timeouts
+            transport = open_transport(hostname, username, private_key, timeout=60, compress=SFTP_COMPRESSION)
+
+            # Open SFTP session for listing, plus a pool of channels for transfers
+            sftp = paramiko.SFTPClient.from_transport(transport)
             sftp.get_channel().settimeout(300)  # 5 minutes for file operations
+            pool = SFTPPool(transport, SFTP_POOL_SIZE)
 
-            return ssh, sftp
+            return transport, sftp, pool
 
         except Exception as e:
             print(f"Connection failed: {e}")
-            if 'ssh' in locals():
+            if transport:
                 try:
-                    ssh.close()
+                    transport.close()
                 except:
                     pass
             raise
 
-    def safe_close_connection(ssh, sftp):
+    def safe_close_connection(transport, sftp, pool=None):
         """Safely close SFTP and SSH connections"""
         try:
             if sftp:
@@ -306,9 +311,12 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
         except:
             pass
 
+        if pool:
+            pool.close()
+
         try:
-            if ssh:
-                ssh.close()
+            if transport:
+                transport.close()
         except:
             pass
 
@@ -320,42 +328,61 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
         except:
             return False
 
-    ssh = None
+    transport = None
     sftp = None
+    pool = None
+
+    # Without the UNO listeners every conversion spawns soffice; clear leftovers from earlier runs once
+    if not libreoffice_pool.available:
+        kill_orphaned_soffice()
 
     try:
         print(f"Connecting to {hostname} as {username}")
-        ssh, sftp = create_connection()
+        transport, sftp, pool = create_connection()
         print("Connected successfully")
 
         print(f"Starting recursive download from {remote_dir} to {local_dir}")
 
-        # Connection health monitoring
+        # Connection health monitoring; used by the walker and by the transfer
+        # workers, so checks keep running while queued downloads drain
         class ConnectionMonitor:
-            def __init__(self, ssh, sftp, create_conn_func):
-                self.ssh = ssh
+            def __init__(self, transport, sftp, pool, create_conn_func):
+                self.transport = transport
                 self.sftp = sftp
+                self.pool = pool
                 self.create_connection = create_conn_func
                 self.last_check = time.time()
                 self.files_since_check = 0
+                self.lock = threading.Lock()
+
+            def current_pool(self, recheck=False):
+                """Pool for a transfer about to start; recheck forces a health check first"""
+                return self.check_and_reconnect_if_needed(force=recheck)[2]
+
+            def check_and_reconnect_if_needed(self, force=False):
+                """Check connection health every 100 files or 30 minutes (or now, if force)"""
+                with self.lock:
+                    return self._check_and_reconnect(force)
 
-            def check_and_reconnect_if_needed(self):
-                """Check connection health every 100 files or 30 minutes"""
+            def _check_and_reconnect(self, force):
                 current_time = time.time()
                 self.files_since_check += 1
 
-                if (self.files_since_check >= 100 or
+                if (force or self.files_since_check >= 100 or
                     current_time - self.last_check > 1800):  # 30 minutes
 
                     print(f"  [HEALTH] Checking connection health after {self.files_since_check} files...")
 
                     if not test_connection(self.sftp):
                         print("  [RECONNECT] Connection lost, reconnecting...")
-                        safe_close_connection(self.ssh, self.sftp)
+                        # Queued transfers look the pool up when they start, so only
+                        # transfers already running on the old pool are affected; they
+                        # fail and retry on the new one via current_pool(recheck=True)
+                        safe_close_connection(self.transport, self.sftp, self.pool)
                         time.sleep(2)
                         gc.collect()
 
-                        self.ssh, self.sftp = self.create_connection()
+                        self.transport, self.sftp, self.pool = self.create_connection()
                         print("  [RECONNECT] Successfully reconnected")
                     else:
                         print("  [HEALTH] Connection is healthy")
@@ -363,17 +390,18 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
                     self.last_check = current_time
                     self.files_since_check = 0
 
-                    return self.ssh, self.sftp
+                    return self.transport, self.sftp, self.pool
 
-                return self.ssh, self.sftp
+                return self.transport, self.sftp, self.pool
 
         # Create connection monitor
-        monitor = ConnectionMonitor(ssh, sftp, create_connection)
+        monitor = ConnectionMonitor(transport, sftp, pool, create_connection)
 
-        # Start download
-        download_sftp_directory_recursive(
-            sftp, remote_dir, local_dir, None, True, monitor, ""
-        )
+        # Start download; leaving the with-block waits for all queued transfers.
+        # Workers block on the SFTP pool while downloading and on the listener
+        # pool while converting, so size it for both to be busy at once
+        with ThreadPoolExecutor(max_workers=SFTP_POOL_SIZE + LIBREOFFICE_WORKERS) as executor:
+            download_sftp_directory_tree(sftp, pool, executor, remote_dir, local_dir, monitor)
         print("Download completed successfully")
 
     except Exception as e:
@@ -381,7 +409,10 @@ def download_sftp_directory(hostname, username, private_key_path, remote_dir, lo
         raise
 
     finally:
-        safe_close_connection(ssh, sftp)
+        # The monitor may have reconnected; close whichever connection is current
+        if 'monitor' in locals():
+            transport, sftp, pool = monitor.transport, monitor.sftp, monitor.pool
+        safe_close_connection(transport, sftp, pool)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,10 @@
-import json
 import os
 import glob
+import queue
+import threading
+
+import numpy as np
+import orjson
 from pymilvus import Collection, connections, utility
 
 from utils.config import config
@@ -9,19 +13,43 @@ from utils.config import config
 def load_mapping_files():
     """Load mapping files for kb_id, file_id, and img_file_list"""
     # Load id_mapping.json
-    with open("data/id_mapping.json", "r") as f:
-        id_mapping = json.load(f)
+    with open("data/id_mapping.json", "rb") as f:
+        id_mapping = orjson.loads(f.read())
 
     # Load img_file_list from 0922.json
-    with open("data/0922.json", "r") as f:
-        img_data = json.load(f)
+    with open("data/0922.json", "rb") as f:
+        img_data = orjson.loads(f.read())
 
     return id_mapping, img_data
 
 
-def process_data_files(data_dir: str, id_mapping: dict, img_data: dict):
-    """Process all JSON files in data_dir and convert to Milvus records"""
-    records = []
+# Columns produced by process_data_files, keyed by Milvus field name
+RECORD_FIELDS = (
+    "kb_id", "file_id", "file_name", "image_file", "content",
+    "metadata", "update_time", "enabled", "embedding", "sparse_vector",
+)
+
+
+# Records per collection.insert call
+INSERT_BATCH_SIZE = 1280
+# Parsed batches allowed to wait for insertion; bounds the memory held ahead of Milvus
+PENDING_BATCHES = 2
+
+
+def _take_batch(columns: dict, size: int) -> dict:
+    """Remove and return the first size records of columns"""
+    batch = {field: values[:size] for field, values in columns.items()}
+    for values in columns.values():
+        del values[:size]
+    return batch
+
+
+def process_data_files(data_dir: str, id_mapping: dict, img_data: dict, batch_size: int = INSERT_BATCH_SIZE):
+    """
+    Process all JSON files in data_dir into Milvus records, yielding them as
+    column arrays of batch_size records (the last batch may be shorter)
+    """
+    columns = {field: [] for field in RECORD_FIELDS}
 
     # Get all JSON files in the data directory
     json_files = glob.glob(os.path.join(data_dir, "*.json"))
@@ -29,8 +57,8 @@ def process_data_files(data_dir: str, id_mapping: dict, img_data: dict):
     for json_file in json_files:
         print(f"Processing {json_file}...")
 
-        with open(json_file, "r") as f:
-            data = json.load(f)
+        with open(json_file, "rb") as f:
+            data = orjson.loads(f.read())
 
         for key, value in data.items():
             # Extract base key (remove "ocr_results:ocr_" prefix if present)
@@ -47,28 +75,53 @@ def process_data_files(data_dir: str, id_mapping: dict, img_data: dict):
             # Get img_file_list from img_data (using original key with prefix)
             img_file_list = img_data.get(key, {}).get("img_file_list", [])
 
-            # Process each page
+            # One record per page; per-file values are repeated down their column
             processed_content = value.get("processed_content", [])
             embeddings = value.get("embeddings", [])
             sparse_embeddings = value.get("sparse_embeddings", [])
+            metadata = value.get("metadata", {})
+            page_count = len(processed_content)
+
+            # Batches are cut by record count, so a short list (e.g. fewer images
+            # than pages) would shift every later record; skip the file instead.
+            # Earlier batches may already be inserted, so don't abort midway
+            short = [
+                field for field, values in (("image_file", img_file_list), ("embedding", embeddings),
+                                            ("sparse_vector", sparse_embeddings))
+                if len(values) < page_count
+            ]
+            if short:
+                print(f"Warning: {key} has fewer than {page_count} values for {short}, skipping...")
+                continue
+
+            columns["kb_id"].extend([kb_id] * page_count)
+            columns["file_id"].extend([file_id] * page_count)
+            columns["file_name"].extend([value.get("file_name", "")] * page_count)
+            columns["image_file"].extend(img_file_list[:page_count])
+            columns["content"].extend(processed_content)
+            columns["metadata"].extend([metadata.get("entity", "")] * page_count)
+            columns["update_time"].extend([metadata.get("time", "")] * page_count)
+            columns["enabled"].extend([True] * page_count)
+            # Keep dense vectors as float32 rows rather than lists of boxed Python floats
+            if page_count:
+                columns["embedding"].extend(np.asarray(embeddings[:page_count], dtype=np.float32))
+            columns["sparse_vector"].extend(sparse_embeddings[:page_count])
 
-            for i in range(len(processed_content)):
-                # Create record for each page
-                record = {
-                    "kb_id": kb_id,
-                    "file_id": file_id,
-                    "file_name": value.get("file_name", ""),
-                    "image_file": img_file_list[i],
-                    "content": processed_content[i],
-                    "metadata": value.get("metadata", {}).get("entity", ""),
-                    "update_time": value.get("metadata", {}).get("time", ""),
-                    "enabled": True,
-                    "embedding": embeddings[i],
-                    "sparse_vector": sparse_embeddings[i]
-                }
-                records.append(record)
-
-    return records
+        while len(columns["content"]) >= batch_size:
+            yield _take_batch(columns, batch_size)
+
+    if columns["content"]:
+        yield _take_batch(columns, len(columns["content"]))
+
+
+def _produce_batches(batches, pending: queue.Queue):
+    """Feed batches into pending, ending with None (or the exception that stopped it)"""
+    try:
+        for batch in batches:
+            pending.put(batch)
+        pending.put(None)
+    except BaseException as e:
+        pending.put(e)
 
 
 def load_data(collection_name: str, data_dir: str = "data/index"):
@@ -76,26 +129,44 @@ def load_data(collection_name: str, data_dir: str = "data/index"):
     collection = Collection(name=collection_name)
     collection.load()
 
+    # Column-based inserts must list the columns in schema order (auto-id primary key excluded)
+    field_names = [
+        field.name for field in collection.schema.fields
+        if not (field.is_primary and field.auto_id)
+    ]
+    missing = [name for name in field_names if name not in RECORD_FIELDS]
+    if missing:
+        raise ValueError(f"Collection {collection_name} has fields with no data: {missing}")
+
     # Load mapping files
     id_mapping, img_data = load_mapping_files()
 
-    # Process all data files
-    records = process_data_files(data_dir, id_mapping, img_data)
-
-    # Insert data in batches of 2560
-    batch_size = 1280
-    total_items = len(records)
-
-    print(f"Total records to insert: {total_items}")
-
-    for i in range(0, total_items, batch_size):
-        batch = records[i : i + batch_size]
-        collection.insert(batch)
-        print(
-            f"Inserted batch {i // batch_size + 1}/{(total_items + batch_size - 1) // batch_size} "
-            f"({len(batch)} items)"
-        )
-
+    # Parse the data files on a producer thread while this thread inserts, so
+    # JSON parsing overlaps with waiting on Milvus
+    pending = queue.Queue(maxsize=PENDING_BATCHES)
+    producer = threading.Thread(
+        target=_produce_batches,
+        args=(process_data_files(data_dir, id_mapping, img_data, INSERT_BATCH_SIZE), pending),
+        daemon=True,
+    )
+    producer.start()
+
+    total_items = 0
+    batch_number = 0
+    while True:
+        batch = pending.get()
+        if batch is None:
+            break
+        if isinstance(batch, BaseException):
+            raise batch
+
+        batch_items = len(batch["content"])
+        collection.insert([batch[name] for name in field_names])
+        batch_number += 1
+        total_items += batch_items
+        print(f"Inserted batch {batch_number} ({batch_items} items, {total_items} total)")
+
+    producer.join()
     collection.flush()
     print(f"Data loaded to {collection_name} (total: {total_items} items)")
 
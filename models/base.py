@@ -1,10 +1,11 @@
 """Simple base service with consistent error handling and database operations."""
 
 import logging
-from typing import Callable, TypeVar
+from typing import Callable, Optional, TypeVar
 
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 
 from utils.psql_client import db
 
@@ -13,39 +14,73 @@ logger = logging.getLogger(__name__)
 T = TypeVar("T")
 
 
+def _raise_http_error(error_message: str, e: Exception):
+    """Log a failed operation and convert it to an HTTPException."""
+    if isinstance(e, HTTPException):
+        # Re-raise HTTP exceptions as-is
+        raise e
+    logger.error(f"{error_message}: {str(e)}")
+    if isinstance(e, SQLAlchemyError):
+        raise HTTPException(status_code=500, detail=f"{error_message}: {str(e)}")
+    raise HTTPException(status_code=500, detail="Internal server error")
+
+
 def with_db_session(
-    operation: Callable, error_message: str = "Database operation failed"
+    operation: Callable,
+    error_message: str = "Database operation failed",
+    *,
+    session: Optional[Session] = None,
 ) -> T:
-    """Execute operation with database session and consistent error handling."""
+    """
+    Execute operation with database session and consistent error handling.
+
+    If session is given the operation runs on it directly; committing it is
+    left to whoever opened it.
+    """
     try:
+        if session is not None:
+            return operation(session)
         with db.get_session_context() as session:
             return operation(session)
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
-    except SQLAlchemyError as e:
-        logger.error(f"{error_message}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"{error_message}: {str(e)}")
     except Exception as e:
-        logger.error(f"{error_message}: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+        _raise_http_error(error_message, e)
 
 
 def with_db_transaction(
-    operation: Callable, error_message: str = "Transaction failed"
+    operation: Callable,
+    error_message: str = "Transaction failed",
+    *,
+    session: Optional[Session] = None,
 ) -> T:
-    """Execute operation with database transaction and consistent error handling."""
+    """
+    Execute operation with database transaction and consistent error handling.
+
+    If session is given the operation joins that session's transaction instead
+    of opening and committing its own.
+    """
     try:
+        if session is not None:
+            return operation(session)
         with db.get_session_context() as session:
-            result = operation(session)
-            session.commit()
-            return result
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
-    except SQLAlchemyError as e:
-        logger.error(f"{error_message}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"{error_message}: {str(e)}")
+            # get_session_context commits on a clean exit
+            return operation(session)
+    except Exception as e:
+        _raise_http_error(error_message, e)
+
+
+def with_db_readonly(
+    operation: Callable, error_message: str = "Database read failed"
+) -> T:
+    """
+    Execute a read-only operation on an AUTOCOMMIT connection.
+
+    Each statement runs on its own, so no BEGIN/COMMIT round trips are made and
+    no transaction is held open while results are consumed.
+    """
+    try:
+        with db.engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            with db.SessionLocal(bind=connection) as session:
+                return operation(session)
     except Exception as e:
-        logger.error(f"{error_message}: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+        _raise_http_error(error_message, e)
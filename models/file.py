@@ -11,6 +11,10 @@ from utils.psql_client import Base
 # SQLAlchemy Models
 class FileDB(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        # KB-wide deletes and per-folder listings filter on these
+        Index("ix_files_kb_id_folder_id", "kb_id", "folder_id"),
+    )
 
     file_id = Column(String, primary_key=True)
     file_name = Column(String, nullable=False)
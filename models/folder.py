@@ -10,6 +10,10 @@ from utils.psql_client import Base
 
 class FolderDB(Base):
     __tablename__ = "folders"
+    __table_args__ = (
+        # KB-wide deletes and folder-tree listings filter on these
+        Index("ix_folders_kb_id_parent", "kb_id", "parent_folder_id"),
+    )
 
     folder_id = Column(String, primary_key=True)
     folder_name = Column(String, nullable=False)
@@ -4,36 +4,43 @@ Utility functions for creating folders and files in the knowledge base system.
 
 import logging
 from datetime import UTC, datetime
+from typing import Optional
 
+import orjson
+from sqlalchemy import delete, text
 from sqlalchemy.orm import Session
 
 from models.folder import FolderDB
 from models.file import FileDB
 from models.base import with_db_transaction
-from utils.id_utils import generate_id
+from utils.id_utils import generate_ids
 
 logger = logging.getLogger(__name__)
 
 
-def delete_all_files_and_folders_in_kb(kb_id: str) -> dict:
+def delete_all_files_and_folders_in_kb(kb_id: str, session: Optional[Session] = None) -> dict:
     """
     Delete all files and folders in a specific knowledge base.
 
     Args:
         kb_id: The knowledge base ID to clear
+        session: Run in this session's transaction instead of a new one
 
     Returns:
         dict: Statistics about deleted items
     """
 
     def operation(session: Session) -> dict:
-        # Delete all files in the KB
-        files_deleted = session.query(FileDB).filter(FileDB.kb_id == kb_id).delete()
+        # Core deletes: no ORM identity-map synchronisation for a bulk wipe.
+        # Files go first since they reference folders; with_db_transaction
+        # commits both in one transaction
+        files_deleted = session.execute(
+            delete(FileDB.__table__).where(FileDB.__table__.c.kb_id == kb_id)
+        ).rowcount
 
-        # Delete all folders in the KB
-        folders_deleted = session.query(FolderDB).filter(FolderDB.kb_id == kb_id).delete()
-
-        session.commit()
+        folders_deleted = session.execute(
+            delete(FolderDB.__table__).where(FolderDB.__table__.c.kb_id == kb_id)
+        ).rowcount
 
         logger.info(f"Deleted {files_deleted} files and {folders_deleted} folders from KB: {kb_id}")
         return {
@@ -42,10 +49,40 @@ def delete_all_files_and_folders_in_kb(kb_id: str) -> dict:
             "kb_id": kb_id
         }
 
-    return with_db_transaction(operation, f"Error deleting files and folders from KB: {kb_id}")
-
-
-def create_folders_batch(user_id: str, kb_id: str, folder_names: list[str]) -> dict[str, str]:
+    return with_db_transaction(operation, f"Error deleting files and folders from KB: {kb_id}", session=session)
+
+
+# Batches are sent as a single jsonb parameter (folders) or one array parameter
+# per column (files) and expanded server-side, so each batch is one round trip
+# regardless of row count (and never hits the bind parameter limit of a
+# multi-row VALUES insert).
+INSERT_FOLDERS_SQL = text("""
+    INSERT INTO folders (
+        folder_id, folder_name, kb_id, parent_folder_id, path,
+        created_at, created_by, updated_at, updated_by, enabled
+    )
+    SELECT x.folder_id, x.folder_name, :kb_id, NULL, x.folder_name,
+           :now, :user_id, :now, :user_id, TRUE
+    FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS x(folder_id text, folder_name text)
+""")
+
+INSERT_FILES_SQL = text("""
+    INSERT INTO files (
+        file_id, file_name, file_hash, size, status, enabled, protective,
+        kb_id, folder_id, created_at, created_by
+    )
+    SELECT x.file_id, x.file_name, x.file_hash, x.file_size, :status, TRUE, FALSE,
+           :kb_id, x.folder_id, :now, :user_id
+    FROM unnest(
+        CAST(:file_ids AS text[]), CAST(:file_names AS text[]), CAST(:file_hashes AS text[]),
+        CAST(:file_sizes AS integer[]), CAST(:folder_ids AS text[])
+    ) AS x(file_id, file_name, file_hash, file_size, folder_id)
+""")
+
+
+def create_folders_batch(
+    user_id: str, kb_id: str, folder_names: list[str], session: Optional[Session] = None
+) -> dict[str, str]:
     """
     Create multiple folders in batch for a knowledge base.
 
@@ -53,86 +90,78 @@ def create_folders_batch(user_id: str, kb_id: str, folder_names: list[str]) -> d
         user_id: The ID of the user creating the folders
         kb_id: The knowledge base ID where folders will be created
         folder_names: List of folder names to create
+        session: Run in this session's transaction instead of a new one
 
     Returns:
         dict: Mapping of folder_name -> folder_id for created folders
     """
 
     def operation(session: Session) -> dict[str, str]:
-        folder_mapping = {}
-        now = datetime.now(UTC)
-
-        folder_objects = []
-        for folder_name in folder_names:
-            folder_id = generate_id('folders')
-            folder_db = FolderDB(
-                folder_id=folder_id,
-                folder_name=folder_name,
-                kb_id=kb_id,
-                parent_folder_id=None,
-                path=folder_name,
-                created_at=now,
-                created_by=user_id,
-                updated_at=now,
-                updated_by=user_id,
-                enabled=True,
-            )
-            folder_objects.append(folder_db)
-            folder_mapping[folder_name] = folder_id
-
-        session.add_all(folder_objects)
-        session.commit()
-
-        logger.info(f"Created {len(folder_objects)} folders in KB: {kb_id}")
+        folder_mapping = dict(zip(folder_names, generate_ids('folders', len(folder_names))))
+        rows = [
+            {"folder_id": folder_id, "folder_name": folder_name}
+            for folder_name, folder_id in folder_mapping.items()
+        ]
+
+        session.execute(INSERT_FOLDERS_SQL, {
+            "rows": orjson.dumps(rows).decode(),
+            "kb_id": kb_id,
+            "user_id": user_id,
+            "now": datetime.now(UTC),
+        })
+
+        logger.info(f"Created {len(rows)} folders in KB: {kb_id}")
         return folder_mapping
 
-    return with_db_transaction(operation, "Error creating folders in batch")
+    return with_db_transaction(operation, "Error creating folders in batch", session=session)
 
 
 def create_files_batch(
     user_id: str,
     kb_id: str,
-    file_data: list[dict]
+    folder_ids: list[str],
+    file_names: list[str],
+    file_hashes: list[str],
+    file_sizes: list[int],
+    status: str = "completed",
+    session: Optional[Session] = None
 ) -> list[str]:
     """
     Create multiple file records in batch for a knowledge base.
 
+    File attributes are passed column-wise; the lists must have equal length
+    and row i is (folder_ids[i], file_names[i], file_hashes[i], file_sizes[i]).
+
     Args:
         user_id: The ID of the user creating the files
         kb_id: The knowledge base ID where files will be created
-        file_data: List of dicts with keys: folder_id, file_name, file_hash, file_size, status
+        folder_ids: Folder ID of each file
+        file_names: Name of each file
+        file_hashes: MD5 hash of each file
+        file_sizes: Size in bytes of each file
+        status: Status assigned to every file in the batch
+        session: Run in this session's transaction instead of a new one
 
     Returns:
         list: List of created file IDs
     """
 
     def operation(session: Session) -> list[str]:
-        file_ids = []
-        now = datetime.now(UTC)
-
-        file_objects = []
-        for file_info in file_data:
-            file_id = generate_id('files')
-            file_db = FileDB(
-                file_id=file_id,
-                file_name=file_info["file_name"],
-                file_hash=file_info["file_hash"],
-                size=file_info["file_size"],
-                status=file_info.get("status", "completed"),
-                enabled=True,
-                protective=False,
-                kb_id=kb_id,
-                folder_id=file_info["folder_id"],
-                created_at=now,
-                created_by=user_id,
-            )
-            file_objects.append(file_db)
-            file_ids.append(file_id)
-
-        session.add_all(file_objects)
-        session.commit()
-
-        logger.info(f"Created {len(file_objects)} files in KB: {kb_id}")
+        file_ids = generate_ids('files', len(file_hashes))
+
+        session.execute(INSERT_FILES_SQL, {
+            "file_ids": file_ids,
+            "file_names": file_names,
+            "file_hashes": file_hashes,
+            "file_sizes": file_sizes,
+            "folder_ids": folder_ids,
+            "status": status,
+            "kb_id": kb_id,
+            "user_id": user_id,
+            "now": datetime.now(UTC),
+        })
+
+        logger.info(f"Created {len(file_ids)} files in KB: {kb_id}")
         return file_ids
 
-    return with_db_transaction(operation, "Error creating files in batch")
\ No newline at end of file
+    return with_db_transaction(operation, "Error creating files in batch", session=session)
@@ -10,15 +10,18 @@ import sys
 import asyncio
 import logging
 import time
-import hashlib
+import io
 import json
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import PyPDF2
+from tqdm import tqdm
 
 from utils.config import config
+from utils.file_hash import md5_file
 from utils.redis_client import redis_client
-from utils.ocr import get_ocr
+from utils.ocr import OCR_SIZES_KEY, get_ocr
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -27,57 +30,116 @@ logger = logging.getLogger(__name__)
 
 max_page_count = 200
 
-def get_pdf_page_count(pdf_path: str) -> int:
-    """Get the number of pages in a PDF file."""
+# Redis keys of cached OCR results are OCR_KEY_PREFIX + <file md5>
+OCR_KEY_PREFIX = "ocr_results:ocr_"
+# Keys checked per pipelined round trip to Redis
+REDIS_PIPELINE_BATCH = 5000
+# Threads listing directories in find_pdf_files
+SCAN_WORKERS = 16
+# Threads hashing PDFs in get_file_md5_mapping
+MD5_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def get_pdf_page_count(pdf_path: str, pdf_data: bytes = None) -> int:
+    """Get the number of pages in a PDF file, parsing pdf_data if the file has already been read."""
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data) if pdf_data is not None else pdf_path)
+        # The root page tree's /Count is the document's page count; reading it
+        # avoids building the full page list just to take its length
+        try:
+            return int(pdf_reader.trailer["/Root"]["/Pages"]["/Count"])
+        except (KeyError, TypeError, ValueError):
             return len(pdf_reader.pages)
     except Exception as e:
         logger.warning(f"Could not get page count for {pdf_path}: {e}")
         return 0
 
 
+def _scan_directory(path: str) -> tuple[list[str], list[str]]:
+    """List one directory: returns (PDF file paths, subdirectory paths)."""
+    pdf_files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # DirEntry carries the type from readdir, so no stat per entry;
+                # like os.walk, symlinked directories are not followed
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                elif entry.name.lower().endswith('.pdf'):
+                    pdf_files.append(entry.path)
+    except OSError as e:
+        logger.warning(f"Could not list {path}: {e}")
+    return pdf_files, subdirs
+
+
 def find_pdf_files(directory: str) -> list[str]:
     """Find all PDF files in the given directory recursively."""
     pdf_files = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                pdf_files.append(os.path.join(root, file))
+    # Each level of the tree is listed in parallel, so directory reads overlap
+    # on a cold cache; map keeps the listing order deterministic
+    level = [directory]
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        while level:
+            next_level = []
+            for files, subdirs in executor.map(_scan_directory, level):
+                pdf_files.extend(files)
+                next_level.extend(subdirs)
+            level = next_level
     return pdf_files
 
 
 def get_file_md5(file_path: str) -> str:
     """Calculate MD5 hash of a file."""
+    # MD5 stays the hash here: it is the file identity in the Redis keys
+    # (ocr_results:ocr_<md5>) and the id mappings
     try:
-        with open(file_path, "rb") as f:
-            file_data = f.read()
-            return hashlib.md5(file_data).hexdigest()
+        return md5_file(file_path)
     except Exception as e:
         logger.error(f"Error calculating MD5 for {file_path}: {e}")
         return None
 
 
-def get_redis_processed_files() -> set:
-    """Get all MD5 hashes of files processed and stored in Redis."""
+# MD5s confirmed to have OCR results in Redis, kept across monitoring ticks so
+# a file is only looked up until its result exists
+_processed_md5s = set()
+
+
+def get_redis_processed_files(md5_hashes: list[str]) -> set:
+    """Return the MD5s in md5_hashes that have OCR results stored in Redis."""
+    # One pipelined EXISTS per candidate, REDIS_PIPELINE_BATCH keys per round
+    # trip: traffic scales with the files being checked, not with everything
+    # ever processed
+    processed = set()
+    for start in range(0, len(md5_hashes), REDIS_PIPELINE_BATCH):
+        batch = md5_hashes[start:start + REDIS_PIPELINE_BATCH]
+        pipe = redis_client.client.pipeline(transaction=False)
+        for md5_hash in batch:
+            pipe.exists(f"{OCR_KEY_PREFIX}{md5_hash}")
+        processed.update(md5_hash for md5_hash, stored in zip(batch, pipe.execute()) if stored)
+    return processed
+
+
+def get_redis_processed_sizes(sizes: list[int]) -> set:
+    """Return the file sizes in sizes that appear in the OCR size index."""
+    known = set()
+    for start in range(0, len(sizes), REDIS_PIPELINE_BATCH):
+        batch = sizes[start:start + REDIS_PIPELINE_BATCH]
+        pipe = redis_client.client.pipeline(transaction=False)
+        for size in batch:
+            pipe.sismember(OCR_SIZES_KEY, size)
+        known.update(size for size, member in zip(batch, pipe.execute()) if member)
+    return known
+
+
+def update_processed_files(md5_hashes: list[str]) -> set:
+    """Look up the MD5s not yet known to be processed; returns the set of processed MD5s."""
+    unknown = [md5_hash for md5_hash in dict.fromkeys(md5_hashes) if md5_hash not in _processed_md5s]
     try:
-        keys = redis_client.client.keys("ocr_results:ocr_*")
-        # Extract MD5 hashes from Redis keys
-        md5_hashes = set()
-        for key in keys:
-            # Handle both string and bytes key formats
-            if isinstance(key, bytes):
-                key = key.decode('utf-8')
-            # Extract MD5 from key format: "ocr_results:ocr_<md5>"
-            if key.startswith("ocr_results:ocr_"):
-                md5_hash = key[16:]  # Remove "ocr_results:ocr_" prefix
-                md5_hashes.add(md5_hash)
-        logger.info(f"Found {len(md5_hashes)} processed files in Redis")
-        return md5_hashes
+        _processed_md5s.update(get_redis_processed_files(unknown))
     except Exception as e:
-        logger.error(f"Error getting Redis processed files: {e}")
-        return set()
+        logger.error(f"Error checking processed files in Redis: {e}")
+    return _processed_md5s
 
 
 def get_file_md5_mapping(pdf_files: list[str]) -> dict[str, str]:
@@ -87,11 +149,13 @@ def get_file_md5_mapping(pdf_files: list[str]) -> dict[str, str]:
 
     logger.info(f"Calculating MD5 hashes for {len(pdf_files)} files...")
 
-    for i, file_path in enumerate(pdf_files):
-        if (i + 1) % 500 == 0:  # Progress logging every 500 files
-            logger.info(f"Progress: {i + 1}/{len(pdf_files)} files processed")
+    # Hash on threads (see utils.file_hash); map keeps results in pdf_files order
+    with ThreadPoolExecutor(max_workers=MD5_WORKERS) as executor:
+        md5_hashes = list(tqdm(
+            executor.map(get_file_md5, pdf_files), total=len(pdf_files), desc="Hashing PDFs"
+        ))
 
-        md5_hash = get_file_md5(file_path)
+    for file_path, md5_hash in zip(pdf_files, md5_hashes):
         if md5_hash:
             md5_mapping[file_path] = md5_hash
         else:
@@ -111,8 +175,29 @@ def get_file_md5_mapping(pdf_files: list[str]) -> dict[str, str]:
 
 def find_unprocessed_files(pdf_files: list[str]) -> tuple[list[str], dict[str, str]]:
     """Find files that haven't been processed (not in Redis)."""
-    redis_processed_md5s = get_redis_processed_files()
-    file_md5_mapping = get_file_md5_mapping(pdf_files)
+    # A size that no processed PDF has means the file is new without hashing it;
+    # only files sharing a size with a processed PDF are hashed and looked up
+    file_sizes = {}
+    for file_path in pdf_files:
+        try:
+            file_sizes[file_path] = os.path.getsize(file_path)
+        except OSError:
+            pass
+    try:
+        known_sizes = get_redis_processed_sizes(list(set(file_sizes.values())))
+    except Exception as e:
+        logger.error(f"Error checking the OCR size index in Redis: {e}")
+        known_sizes = None
+    if known_sizes is None:
+        files_to_hash = pdf_files
+    else:
+        # Files that could not be stat'ed are hashed too, so they are reported as failed
+        files_to_hash = [path for path in pdf_files if path not in file_sizes or file_sizes[path] in known_sizes]
+    new_by_size = len(pdf_files) - len(files_to_hash)
+    logger.info(f"{new_by_size} files have a size no processed file has; hashing the other {len(files_to_hash)}")
+
+    file_md5_mapping = get_file_md5_mapping(files_to_hash)
+    redis_processed_md5s = update_processed_files(list(file_md5_mapping.values()))
 
     unprocessed_files = []
     unprocessed_md5_mapping = {}
@@ -120,7 +205,15 @@ def find_unprocessed_files(pdf_files: list[str]) -> tuple[list[str], dict[str, s
 
     logger.info(f"Comparing {len(file_md5_mapping)} files with {len(redis_processed_md5s)} Redis entries...")
 
-    for file_path, md5_hash in file_md5_mapping.items():
+    hashed = set(files_to_hash)
+    for file_path in pdf_files:
+        if file_path not in hashed:
+            # New by size; get_ocr hashes it when it is processed
+            unprocessed_files.append(file_path)
+            continue
+        md5_hash = file_md5_mapping.get(file_path)
+        if md5_hash is None:
+            continue
         if md5_hash not in redis_processed_md5s:
             unprocessed_files.append(file_path)
             unprocessed_md5_mapping[file_path] = md5_hash
@@ -130,17 +223,18 @@ def find_unprocessed_files(pdf_files: list[str]) -> tuple[list[str], dict[str, s
     # Calculate the accounting
     total_files = len(pdf_files)
     files_with_md5 = len(file_md5_mapping)
-    files_failed_md5 = total_files - files_with_md5
+    files_failed_md5 = len(files_to_hash) - files_with_md5
     files_processed = processed_files_count
     files_unprocessed = len(unprocessed_files)
 
     logger.info("=== FILE PROCESSING SUMMARY ===")
     logger.info(f"Total PDF files found: {total_files}")
+    logger.info(f"Files new by size (not hashed): {new_by_size}")
     logger.info(f"Files with successful MD5: {files_with_md5}")
     logger.info(f"Files that failed MD5 calculation: {files_failed_md5}")
     logger.info(f"Files already processed (in Redis): {files_processed}")
     logger.info(f"Files to be processed: {files_unprocessed}")
-    logger.info(f"Verification: {files_with_md5} = {files_processed} + {files_unprocessed} ✓")
+    logger.info(f"Verification: {new_by_size} + {files_with_md5} = {files_processed} + {files_unprocessed} ✓")
 
     if files_unprocessed > 0:
         logger.info(f"Found {len(unprocessed_files)} unprocessed files:")
@@ -153,37 +247,42 @@ def find_unprocessed_files(pdf_files: list[str]) -> tuple[list[str], dict[str, s
 
 
 
-async def process_pdf_file(pdf_path: str, semaphore: asyncio.Semaphore) -> dict:
-    """Process a single PDF file using the OCR service with concurrency control."""
-    async with semaphore:
-        try:
-            # Get page count before processing
-            page_count = get_pdf_page_count(pdf_path)
-            file_name = os.path.basename(pdf_path)
-
-            # Skip files with more than max_page_count pages
-            if page_count > max_page_count:
-                logger.info(f"Skipping large file: {file_name} ({page_count} pages > {max_page_count} page limit)")
-                return {"file": pdf_path, "status": "skipped", "reason": f"Too many pages ({page_count} > {max_page_count})"}
-
-            logger.info(f"Processing: data/policy/{file_name} page_count: {page_count}")
-
-            # Call the OCR function with appropriate parameters
-            result = await get_ocr(
-                input_file=pdf_path,
-                file_category="mixed",
-                file_suffix="pdf",
-                prompt="",
-                max_pages=None,
-                override=False
-            )
-
-            logger.info(f"Successfully processed: {pdf_path}")
-            return {"file": pdf_path, "status": "success", "result": result}
+async def process_pdf_file(pdf_path: str, file_md5: str = None) -> dict:
+    """Process a single PDF file using the OCR service."""
+    try:
+        # Read the file once; the page count check and the OCR request share the bytes
+        with open(pdf_path, "rb") as f:
+            pdf_data = f.read()
+
+        # Get page count before processing
+        page_count = get_pdf_page_count(pdf_path, pdf_data)
+        file_name = os.path.basename(pdf_path)
+
+        # Skip files with more than max_page_count pages
+        if page_count > max_page_count:
+            logger.info(f"Skipping large file: {file_name} ({page_count} pages > {max_page_count} page limit)")
+            return {"file": pdf_path, "status": "skipped", "reason": f"Too many pages ({page_count} > {max_page_count})"}
+
+        logger.info(f"Processing: data/policy/{file_name} page_count: {page_count}")
+
+        # Call the OCR function with appropriate parameters
+        result = await get_ocr(
+            input_file=pdf_path,
+            file_category="mixed",
+            file_suffix="pdf",
+            prompt="",
+            max_pages=None,
+            override=False,
+            file_data=pdf_data,
+            file_md5=file_md5
+        )
+
+        logger.info(f"Successfully processed: {pdf_path}")
+        return {"file": pdf_path, "status": "success", "result": result}
 
-        except Exception as e:
-            logger.error(f"Error processing {pdf_path}: {str(e)}")
-            return {"file": pdf_path, "status": "error", "error": str(e)}
+    except Exception as e:
+        logger.error(f"Error processing {pdf_path}: {str(e)}")
+        return {"file": pdf_path, "status": "error", "error": str(e)}
 
 
 async def process_new_files(directory_path: str):
@@ -219,8 +318,7 @@ async def process_new_files(directory_path: str):
     if not new_files:
         logger.info("No new or unprocessed PDF files found")
         # Display current Redis statistics
-        redis_processed_md5s = get_redis_processed_files()
-        logger.info(f"Total files processed and stored in Redis: {len(redis_processed_md5s)}")
+        logger.info(f"Files processed and stored in Redis: {len(_processed_md5s)}")
         return
 
     logger.info(f"Found {len(new_files)} new or unprocessed PDF files to process")
@@ -234,23 +332,32 @@ async def process_new_files(directory_path: str):
     logger.info(f"Using OCR service at: {config.ocr_url}")
     logger.info(f"Processing with max concurrency: {max_concurrency}")
 
-    # Create semaphore to limit concurrent operations
-    semaphore = asyncio.Semaphore(max_concurrency)
-
-    # Process files concurrently
-    tasks = []
-    for pdf_file in new_files:
-        task = process_pdf_file(pdf_file, semaphore)
-        tasks.append(task)
-
-    # Execute all tasks concurrently and collect results
-    logger.info(f"Starting concurrent processing of {len(tasks)} files...")
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    # A fixed set of workers pulls files from a queue, so only max_concurrency
+    # coroutines exist at a time however many files are waiting
+    queue = asyncio.Queue()
+    for index, pdf_file in enumerate(new_files):
+        queue.put_nowait((index, pdf_file))
+    results = [None] * len(new_files)
+
+    async def worker():
+        while True:
+            try:
+                index, pdf_file = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                results[index] = await process_pdf_file(pdf_file, file_md5_mapping.get(pdf_file))
+            except Exception as e:
+                results[index] = e
+
+    logger.info(f"Starting concurrent processing of {len(new_files)} files...")
+    await asyncio.gather(*(worker() for _ in range(min(max_concurrency, len(new_files)))))
 
     # Process results
     successful = 0
     failed = 0
     skipped = 0
+    successful_md5s = []
 
     for i, result in enumerate(results):
         file_path = new_files[i]
@@ -261,6 +368,9 @@ async def process_new_files(directory_path: str):
             logger.error(f"✗ Exception processing {file_path}: {str(result)}")
         elif result["status"] == "success":
             successful += 1
+            # Files queued as new by size were not hashed here; the next check finds them
+            if file_md5:
+                successful_md5s.append(file_md5)
             logger.info(f"✓ Processed {result['file']} (MD5: {file_md5})")
         elif result["status"] == "skipped":
             skipped += 1
@@ -271,33 +381,9 @@ async def process_new_files(directory_path: str):
 
     logger.info(f"Processing complete. Successful: {successful}, Failed: {failed}, Skipped: {skipped}")
 
-    # Display updated Redis statistics
-    if redis_available:
-        try:
-            keys = redis_client.client.keys("ocr_results:*")
-            logger.info(f"Total Redis keys with 'ocr_results:' prefix: {len(keys)}")
-
-            # Show sample keys
-            sample_keys = []
-            for key in keys[:10]:
-                if isinstance(key, bytes):
-                    sample_keys.append(key.decode('utf-8'))
-                else:
-                    sample_keys.append(key)
-
-            for key in sample_keys:
-                logger.info(f"  {key}")
-            if len(keys) > 10:
-                logger.info(f"  ... and {len(keys) - 10} more keys")
-
-            # Display accurate count of processed files
-            redis_processed_md5s = get_redis_processed_files()
-            logger.info(f"Accurate count of processed files in Redis: {len(redis_processed_md5s)}")
-
-        except Exception as e:
-            logger.error(f"Error listing Redis keys: {str(e)}")
-    else:
-        logger.info("Redis not available - results not cached")
+    # Display updated Redis statistics; only this run's results are checked,
+    # not the whole keyspace
+    logger.info(f"Files processed and stored in Redis: {len(update_processed_files(successful_md5s))}")
 
 
 async def run_continuous_monitoring(directory_path: str = "data/policy"):
@@ -20,10 +20,12 @@ Dependencies:
 
 import asyncio
 import json
+import os
 import re
 import sys
 from pathlib import Path
 from typing import List, Dict, Any
+import orjson
 from tqdm.asyncio import tqdm
 import traceback
 import multiprocessing as mp
@@ -35,6 +37,9 @@ from utils.embedding import clean_html_tags, get_embedding, get_sparse_embedding
 from utils.open_api import qwen_vl_predict
 from utils.lang_detect import detect_language
 
+# A substring repeated more than 20 times in a row (OCR loops); collapsed to one copy
+REPEAT_RE = re.compile(r"(.+?)\1{20,}")
+
 
 async def get_file_metadata(content: List[str], file_name: str) -> Dict[str, str]:
     """
@@ -55,7 +60,9 @@ async def get_file_metadata(content: List[str], file_name: str) -> Dict[str, str
     file_summary = await qwen_vl_predict(
         sys_prompt=sys_prompt, user_prompt=f"file_name: {file_name}\nfirst page:\n{content[0]}"
     )
-    return eval(repair_json(file_summary))
+    # Let json_repair return the parsed object directly; eval() would run
+    # whatever the model emitted and rejects JSON literals like true/null
+    return repair_json(file_summary, return_objects=True)
 
 
 async def process_content(content: List[str], file_name: str) -> List[str]:
@@ -70,7 +77,7 @@ async def process_content(content: List[str], file_name: str) -> List[str]:
         List of processed content with context summaries
     """
     # Clean HTML tags and remove repetitive text patterns
-    content = [clean_html_tags(re.sub(r"(.+?)\1{20,}", lambda m: m.group(1), text)) if text and text.strip() else "" for text in content]
+    content = [clean_html_tags(REPEAT_RE.sub(r"\1", text)) if text and text.strip() else "" for text in content]
 
     # Detect language based on first 5 pages
     lang = detect_language("\n".join(content[:5]))
@@ -80,10 +87,10 @@ async def process_content(content: List[str], file_name: str) -> List[str]:
         user_prompt=f"summary the file {file_name} in one sentence in {lang}:\nFirst two pages:\n{'\n'.join(content[:2])}"
     )
 
-    # Prepare prompts for context generation
-    prompts = []
-    for i, text in enumerate(content[1:]):
-        sys_prompt = f"""Generate a concise contextual summary for the current page to enhance search retrieval. The summary should:
+    # Prepare prompts for context generation. The system prompt, file summary
+    # included, is identical for every page of the file, so the serving side
+    # can reuse its cached prefix; only the page window varies per request
+    sys_prompt = f"""Generate a concise contextual summary for the current page to enhance search retrieval. The summary should:
 1. Provide essential background information, key concepts and fitting conditions
 2. Highlight relationships with previous content
 3. Make the current page self-contained and understandable
@@ -93,10 +100,12 @@ Requirements:
 - Length: Maximum 100 words
 - Style: Clear, factual, and objective
 - Focus: Emphasize unique identifiers, technical terms, and critical details
+
+File Summary: {file_summary}
 """
+    prompts = []
+    for i, text in enumerate(content[1:]):
         user_prompt = f"""
-File Summary: {file_summary}
-
 ============Previous Content============
 {"\n".join(content[max(0, i - 2) : i + 1])}
 
@@ -142,8 +151,10 @@ async def generate_embeddings(processed_content: List[str]) -> List[List[float]]
     Returns:
         List of normalized embedding vectors
     """
-    embeddings = await get_embedding(processed_content)
-    sparse_embeddings = await get_sparse_embedding(processed_content)
+    # The dense and sparse models are separate services; query them concurrently
+    embeddings, sparse_embeddings = await asyncio.gather(
+        get_embedding(processed_content), get_sparse_embedding(processed_content)
+    )
     return embeddings, sparse_embeddings
 
 
@@ -152,15 +163,48 @@ def load_ocr_json(file_path: str) -> Dict[str, Any]:
     Load OCR JSON data from file.
 
     Args:
-        file_path: Path to the OCR JSON file
+        file_path: Path to the OCR JSON file, or an NDJSON backup (.jsonl)
+            with one {key: value} object per line
 
     Returns:
         Dictionary containing OCR data
     """
     with open(file_path, 'r', encoding='utf-8') as f:
+        if Path(file_path).suffix == '.jsonl':
+            data = {}
+            for line in f:
+                if line.strip():
+                    data.update(json.loads(line))
+            return data
         return json.load(f)
 
 
+def write_part_file(results, part_file: Path) -> int:
+    """
+    Write (key, result) pairs to part_file as one JSON object, serialising each
+    pair as it arrives so the batch is never held in memory.
+
+    The object is written to a temporary file and renamed into place when
+    complete, so an interrupted batch never leaves a part file that a rerun
+    would skip.
+
+    Returns:
+        Number of pairs written
+    """
+    temp_file = part_file.with_name(part_file.name + ".tmp")
+    count = 0
+    with open(temp_file, 'wb') as f:
+        f.write(b'{')
+        for key, result in results:
+            if count:
+                f.write(b',')
+            f.write(b'\n' + orjson.dumps(key) + b': ' + orjson.dumps(result))
+            count += 1
+        f.write(b'\n}')
+    os.replace(temp_file, part_file)
+    return count
+
+
 def process_single_file_sync(args):
     """
     Synchronous wrapper for processing a single file in a separate process.
@@ -277,19 +321,18 @@ def main():
         timeout_per_file = 300  # 5 minutes per file
         max_workers = min(mp.cpu_count(), 32)  # Limit to avoid overwhelming the system
 
-        tasks = []
-        all_keys = sorted(list(ocr_data.keys()))
-        for key in all_keys:
-            file_name = mapping[key.removeprefix("ocr_results:ocr_")]["file_name"]
-            content = ocr_data[key]['text']
-            tasks.append((key, file_name, content, timeout_per_file))
+        # One pass over the sorted keys; sorted() takes the dict's keys directly
+        tasks = [
+            (key, mapping[key.removeprefix("ocr_results:ocr_")]["file_name"], ocr_data[key]['text'], timeout_per_file)
+            for key in sorted(ocr_data)
+        ]
 
         print(f"Processing {len(tasks)} files with {max_workers} workers...")
 
         # Process items in batches with multiprocessing
         batch_size = 2000
         part_number = 1
-        all_results = {}
+        total_processed = 0
 
         total_batches = (len(tasks) + batch_size - 1) // batch_size
 
@@ -299,46 +342,39 @@ def main():
 
             if part_file.exists():
                 print(f"Part file {part_file} already exists, skipping batch {part_number}/{total_batches}")
-                # Load existing data to include in final result
-                with open(part_file, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                    all_results.update(existing_data)
+                # Count the existing results toward the final total
+                with open(part_file, 'rb') as f:
+                    total_processed += len(orjson.loads(f.read()))
                 part_number += 1
                 continue
 
             batch_tasks = tasks[i:i + batch_size]
             print(f"Processing batch {part_number}/{total_batches} with {len(batch_tasks)} files...")
 
-            # Process batch using multiprocessing
-            batch_data = {}
-
-            # Use multiprocessing Pool to process files in parallel
+            # Use multiprocessing Pool to process files in parallel; each result
+            # is written to the part file as it arrives instead of being held
+            # until the batch ends
             with mp.Pool(processes=max_workers) as pool:
                 # Use tqdm for progress tracking
                 with tqdm(total=len(batch_tasks), desc=f"Batch {part_number}/{total_batches}") as pbar:
-                    results = []
-                    for result in pool.imap_unordered(process_single_file_sync, batch_tasks):
-                        results.append(result)
-                        pbar.update(1)
-
-                    for key, file_result in results:
-                        if file_result is not None:
-                            batch_data[key] = file_result
-                            all_results[key] = file_result
-                        else:
-                            print(f"Skipping failed file: {key}")
+                    def completed():
+                        for key, file_result in pool.imap_unordered(process_single_file_sync, batch_tasks):
+                            pbar.update(1)
+                            if file_result is None:
+                                print(f"Skipping failed file: {key}")
+                                continue
+                            yield key, file_result
 
-            print(f"Batch {part_number} completed: {len(batch_data)} files processed successfully")
+                    print(f"Saving batch {part_number} to: {part_file}")
+                    batch_count = write_part_file(completed(), part_file)
 
-            # Save part file
-            print(f"Saving batch {part_number} to: {part_file}")
-            with open(part_file, 'w', encoding='utf-8') as f:
-                json.dump(batch_data, f, ensure_ascii=False, indent=2)
+            print(f"Batch {part_number} completed: {batch_count} files processed successfully")
+            total_processed += batch_count
 
             part_number += 1
 
         print(f"Processing completed. Part files saved in: {output_dir}")
-        print(f"Total files processed: {len(all_results)}")
+        print(f"Total files processed: {total_processed}")
 
     except Exception as e:
         print(f"Error processing file: {str(e)}")
@@ -0,0 +1,71 @@
+"""
+SQLite cache of finished document conversions.
+
+Maps a remote source file, identified by path, size and mtime, to the local PDF
+converted from it. When the same source turns up again, for example when its
+attachments are renumbered, the PDF is hardlinked into place instead of
+downloading and converting the file again.
+"""
+
+import os
+import shutil
+import sqlite3
+from typing import Optional
+
+
+class ConvertCache:
+    """(remote_path, size, mtime) -> local PDF path, stored in a SQLite file."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "remote_path TEXT PRIMARY KEY, file_name TEXT, size INTEGER, mtime INTEGER, local_pdf TEXT)"
+        )
+        self.conn.commit()
+
+    def lookup(self, remote_path: str, size: int, mtime: int) -> Optional[str]:
+        """
+        Find a PDF previously converted from this source.
+
+        Only the same remote_path is matched: attachments in different folders
+        often share a name, size and mtime without having the same content.
+
+        Returns:
+            Path of an existing local PDF, or None
+        """
+        row = self.conn.execute(
+            "SELECT local_pdf FROM cache WHERE remote_path = ? AND size = ? AND mtime = ?",
+            (remote_path, size, mtime),
+        ).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+
+    def store(self, remote_path: str, size: int, mtime: int, local_pdf: str):
+        """Record that remote_path (at this size/mtime) was converted to local_pdf."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cache (remote_path, file_name, size, mtime, local_pdf) VALUES (?, ?, ?, ?, ?)",
+            (remote_path, os.path.basename(remote_path), size, mtime, os.path.abspath(local_pdf)),
+        )
+        self.conn.commit()
+
+    def link_cached(self, cached_pdf: str, target_pdf: str) -> bool:
+        """Hardlink (or copy, across filesystems) a cached PDF to target_pdf."""
+        if os.path.abspath(cached_pdf) == os.path.abspath(target_pdf):
+            return True
+        try:
+            try:
+                os.link(cached_pdf, target_pdf)
+            except OSError:
+                shutil.copy2(cached_pdf, target_pdf)
+            return True
+        except OSError as e:
+            print(f"  [WARNING] Could not reuse cached PDF {cached_pdf}: {e}")
+            return False
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,29 @@
+"""
+Memory-mapped reads and MD5 hashing of local files.
+
+Files are mapped read-only and hashed or parsed straight from the page cache,
+with no read() copies. hashlib releases the GIL while hashing, so callers can
+hash many files in parallel on a thread pool.
+"""
+
+import hashlib
+import mmap
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def mapped_file(path: str):
+    """Yield a read-only mmap of path (b'' for an empty file, which mmap cannot map)."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+def md5_file(path: str) -> str:
+    """MD5 hex digest of a file's contents."""
+    with mapped_file(path) as data:
+        return hashlib.md5(data).hexdigest()
@@ -41,6 +41,27 @@ def generate_id(table_name: str) -> str:
         raise ValueError(f"Unsupported table name: {table_name}. Supported tables: {list(TablePrefix.__members__.keys())}")
 
 
+def generate_ids(table_name: str, count: int) -> list[str]:
+    """
+    Generate count new IDs for a table, resolving the prefix once.
+    
+    Args:
+        table_name: The name of the database table (e.g., 'files', 'folders')
+        count: Number of IDs to generate
+    
+    Returns:
+        list[str]: Prefixed ULIDs
+    
+    Raises:
+        ValueError: If table_name is not supported
+    """
+    try:
+        prefix = TablePrefix[table_name.upper()].value
+    except KeyError:
+        raise ValueError(f"Unsupported table name: {table_name}. Supported tables: {list(TablePrefix.__members__.keys())}")
+    return [prefix + str(ULID()) for _ in range(count)]
+
+
 # Convenience function for backward compatibility and easy access to supported tables
 def get_supported_tables() -> list[str]:
     """Return list of supported table names."""
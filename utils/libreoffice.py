@@ -0,0 +1,303 @@
+"""
+Persistent headless LibreOffice instance driven over UNO.
+
+Starting soffice per document pays process startup, profile and font cache
+initialisation every time. LibreOfficeServer starts one listener on first use
+and converts documents through the UNO bridge, restarting it only when it dies
+or a conversion hangs. LibreOfficeServerPool runs several listeners side by side.
+convert_with_soffice is the one-off command-line fallback when no listener is
+available.
+"""
+
+import atexit
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from typing import Optional
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:
+    uno = None
+
+
+SOFFICE_FLAGS = [
+    '--headless',
+    '--invisible',
+    '--nodefault',
+    '--nolockcheck',
+    '--nologo',
+    '--norestore',
+]
+
+
+# Seconds between SIGTERM and SIGKILL for a timed-out soffice process group
+KILL_GRACE_SECONDS = 1
+
+
+def kill_orphaned_soffice():
+    """Kill headless soffice processes left orphaned (reparented to init) by an earlier run"""
+    subprocess.run(
+        "pgrep -P 1 -f 'soffice.*--headless' | xargs -r kill -9",
+        shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def convert_with_soffice(input_file: str, output_dir: str, timeout: int) -> Optional[str]:
+    """
+    Convert a document to PDF with a one-off command-line soffice.
+
+    Used when no UNO listener is available. The process group is killed if
+    the conversion takes longer than timeout seconds.
+
+    Returns:
+        Path of the PDF written to output_dir, or None
+    """
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    output_file = os.path.join(output_dir, f"{base_name}.pdf")
+
+    try:
+        cmd = [
+            'soffice',
+            *SOFFICE_FLAGS,
+            '--convert-to', 'pdf',
+            '--outdir', output_dir,
+            input_file
+        ]
+
+        print(f"  [CONVERT] Starting LibreOffice conversion: {os.path.basename(input_file)}")
+
+        # Own session, so soffice and any children form one process group (pgid == pid)
+        # that can be killed on timeout without scanning the process table
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True
+        )
+        try:
+            _, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"  [TIMEOUT] LibreOffice conversion timeout for {os.path.basename(input_file)} ({timeout}s)")
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+                time.sleep(KILL_GRACE_SECONDS)
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            except Exception as kill_error:
+                print(f"  [WARNING] Could not kill timed-out process: {kill_error}")
+            proc.communicate()
+            return None
+
+        if proc.returncode == 0:
+            if os.path.exists(output_file):
+                print(f"  [SUCCESS] LibreOffice conversion completed: {os.path.basename(output_file)}")
+                return output_file
+            else:
+                print(f"  [ERROR] LibreOffice conversion succeeded but output file not found: {base_name}.pdf")
+                return None
+        else:
+            print(f"  [ERROR] LibreOffice conversion failed with code {proc.returncode}: {stderr.strip()}")
+            return None
+
+    except Exception as e:
+        print(f"  [ERROR] LibreOffice conversion error for {os.path.basename(input_file)}: {e}")
+        return None
+
+
+def _prop(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class LibreOfficeServer:
+    """One soffice UNO listener; conversions are serialized through a lock."""
+
+    def __init__(self, port: int = 2002, startup_timeout: int = 30, convert_timeout: int = 30):
+        self.port = port
+        self.startup_timeout = startup_timeout
+        self.convert_timeout = convert_timeout
+        self.process = None
+        self.desktop = None
+        self.profile_dir = f"/tmp/lo_profile_{os.getpid()}_{port}"
+        self.lock = threading.Lock()
+        self.start_failed = False
+
+    @property
+    def available(self) -> bool:
+        """True if the UNO bridge can be imported and the listener has not failed to start."""
+        return uno is not None and not self.start_failed
+
+    def start(self):
+        """Start the listener and connect to its Desktop service."""
+        cmd = [
+            'soffice',
+            *SOFFICE_FLAGS,
+            f'--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext',
+            f'-env:UserInstallation=file://{self.profile_dir}',
+        ]
+        print(f"  [LIBREOFFICE] Starting UNO listener on port {self.port}")
+        self.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,  # own process group, so it can be killed as a whole
+        )
+
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        deadline = time.time() + self.startup_timeout
+        while True:
+            try:
+                ctx = resolver.resolve(
+                    f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+                )
+                break
+            except NoConnectException:
+                if time.time() > deadline or self.process.poll() is not None:
+                    self.kill()
+                    raise RuntimeError(f"LibreOffice listener did not start on port {self.port}")
+                time.sleep(0.5)
+
+        self.desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+    def kill(self):
+        """Kill the listener's whole process group."""
+        if self.process and self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait(timeout=5)
+            except Exception as e:
+                print(f"  [WARNING] Could not kill LibreOffice listener: {e}")
+        self.process = None
+        self.desktop = None
+
+    def stop(self):
+        """Terminate the listener and remove its profile directory."""
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+                self.process.wait(timeout=10)
+            except Exception:
+                pass
+        self.kill()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None and self.desktop is not None
+
+    def convert(self, input_file: str, output_file: str) -> bool:
+        """
+        Convert a document to PDF.
+
+        A watchdog kills the listener if a conversion exceeds convert_timeout;
+        the next call then starts a fresh one.
+
+        If the listener cannot be started, the server marks itself unavailable
+        so callers can fall back to command-line conversion.
+
+        Returns:
+            True if output_file was written
+        """
+        with self.lock:
+            if self.start_failed:
+                return False
+            if not self.is_alive():
+                self.kill()
+                try:
+                    self.start()
+                except Exception as e:
+                    print(f"  [WARNING] LibreOffice listener unavailable: {e}")
+                    self.kill()
+                    self.start_failed = True
+                    return False
+
+            watchdog = threading.Timer(self.convert_timeout, self.kill)
+            watchdog.start()
+            try:
+                doc = self.desktop.loadComponentFromURL(
+                    uno.systemPathToFileUrl(os.path.abspath(input_file)),
+                    "_blank", 0, (_prop("Hidden", True),)
+                )
+                if doc is None:
+                    print(f"  [ERROR] LibreOffice could not open {os.path.basename(input_file)}")
+                    return False
+                try:
+                    if doc.supportsService("com.sun.star.presentation.PresentationDocument"):
+                        filter_name = "impress_pdf_Export"
+                    elif doc.supportsService("com.sun.star.sheet.SpreadsheetDocument"):
+                        filter_name = "calc_pdf_Export"
+                    else:
+                        filter_name = "writer_pdf_Export"
+                    doc.storeToURL(
+                        uno.systemPathToFileUrl(os.path.abspath(output_file)),
+                        (_prop("FilterName", filter_name),)
+                    )
+                finally:
+                    doc.close(True)
+                return os.path.exists(output_file)
+            except Exception as e:
+                if not watchdog.is_alive():
+                    print(f"  [TIMEOUT] LibreOffice conversion timeout for {os.path.basename(input_file)} ({self.convert_timeout}s)")
+                else:
+                    print(f"  [ERROR] LibreOffice conversion error for {os.path.basename(input_file)}: {e}")
+                    self.kill()
+                return False
+            finally:
+                watchdog.cancel()
+
+
+class LibreOfficeServerPool:
+    """
+    Several listeners, each on its own port and profile, so documents convert in
+    parallel. Each listener still converts one document at a time.
+    """
+
+    def __init__(self, size: int, base_port: int = 2002, startup_timeout: int = 30, convert_timeout: int = 30):
+        self.servers = [
+            LibreOfficeServer(base_port + i, startup_timeout, convert_timeout)
+            for i in range(size)
+        ]
+        self.idle = queue.Queue()
+        for server in self.servers:
+            self.idle.put(server)
+
+    @property
+    def available(self) -> bool:
+        """
+        True if the UNO bridge can be imported and no listener has failed to
+        start; the listeners share one soffice install, so one failure is
+        taken to mean the rest will fail too.
+        """
+        return uno is not None and not any(server.start_failed for server in self.servers)
+
+    def convert(self, input_file: str, output_file: str) -> bool:
+        """Convert on the next idle listener (started on first use); see LibreOfficeServer.convert"""
+        server = self.idle.get()
+        try:
+            if not self.available:
+                return False
+            return server.convert(input_file, output_file)
+        finally:
+            self.idle.put(server)
+
+    def stop(self):
+        for server in self.servers:
+            server.stop()
+
+
+# Global instance, started lazily on first conversion
+libreoffice_server = LibreOfficeServer()
+atexit.register(libreoffice_server.stop)
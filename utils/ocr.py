@@ -13,6 +13,11 @@ from utils.redis_client import redis_client
 
 logger = logging.getLogger(__name__)
 
+# Redis set of the byte sizes of PDFs with cached OCR results, so callers can
+# treat a PDF whose size is not in it as new without hashing it. Sizes of
+# results cached before the set existed are added on their next cache hit
+OCR_SIZES_KEY = "ocr_sizes"
+
 
 async def get_ocr(
     input_file: str = None,
@@ -21,20 +26,32 @@ async def get_ocr(
     prompt: str = "",
     max_pages: int = None,
     override: bool = False,
+    file_data: bytes = None,
+    file_md5: str = None,
 ) -> dict:
+    """
+    OCR a file through the OCR service; PDF results are cached in Redis by MD5.
+
+    Callers that already hold the file's bytes and/or MD5 can pass file_data
+    and file_md5 so the file is not read or hashed again.
+    """
     pdf_md5 = None
     file_content = None
-    
+
     if file_suffix == "pdf":
-        with open(input_file, "rb") as f:
-            file_data = f.read()
-            pdf_md5 = hashlib.md5(file_data).hexdigest()
-            file_content = base64.b64encode(file_data).decode("utf-8")
+        if file_data is None:
+            with open(input_file, "rb") as f:
+                file_data = f.read()
+        pdf_md5 = file_md5 or hashlib.md5(file_data).hexdigest()
         if not override and pdf_md5:
             cached_result = redis_client.get(f"ocr_results:ocr_{pdf_md5}")
             if cached_result:
                 logger.info(f"cache hit for {pdf_md5}")
+                # Backfills the size index for results cached before it existed
+                redis_client.client.sadd(OCR_SIZES_KEY, len(file_data))
                 return json.loads(cached_result)
+        # Only encode for the request once the cache has missed
+        file_content = base64.b64encode(file_data).decode("utf-8")
 
     timeout = aiohttp.ClientTimeout(total=3600)
     async with aiohttp.ClientSession(timeout=timeout) as session:
@@ -53,8 +70,9 @@ async def get_ocr(
     if "error" in r:
         raise Exception(r["error"])
     elif pdf_md5:
-        # Set key without expiration using direct Redis client
-        redis_client.client.set(
-            f"ocr_results:ocr_{pdf_md5}", json.dumps(r, ensure_ascii=False)
-        )
+        # Set key without expiration using direct Redis client, and index its size
+        pipe = redis_client.client.pipeline(transaction=False)
+        pipe.set(f"ocr_results:ocr_{pdf_md5}", json.dumps(r, ensure_ascii=False))
+        pipe.sadd(OCR_SIZES_KEY, len(file_data))
+        pipe.execute()
     return r
@@ -32,6 +32,13 @@ class RedisClient:
             print(f"Error getting key from Redis: {e}")
             return None
 
+    def mget(self, keys: list[str]) -> list[str | None] | None:
+        try:
+            return self.client.mget(keys)
+        except Exception as e:
+            print(f"Error getting keys from Redis: {e}")
+            return None
+
     def list(self) -> list[str] | None:
         try:
             return self.client.keys()
@@ -39,6 +46,13 @@ class RedisClient:
             print(f"Error listing key from Redis: {e}")
             return None
 
+    def scan_keys(self, match: str, count: int = 1000) -> list[str] | None:
+        try:
+            return list(self.client.scan_iter(match=match, count=count))
+        except Exception as e:
+            print(f"Error scanning keys from Redis: {e}")
+            return None
+
     def delete(self, key: str) -> bool:
         try:
             return bool(self.client.delete(key))
@@ -46,5 +60,12 @@ class RedisClient:
             print(f"Error deleting key from Redis: {e}")
             return False
 
+    def delete_many(self, keys: list[str]) -> int:
+        try:
+            return self.client.delete(*keys) if keys else 0
+        except Exception as e:
+            print(f"Error deleting keys from Redis: {e}")
+            return 0
+
 
 redis_client = RedisClient()
@@ -0,0 +1,146 @@
+"""
+SFTP helpers shared by the SFTP download scripts.
+
+open_transport builds an SSH transport tuned for bulk transfer (large flow
+control window, no rekeying mid-transfer, tuned TCP socket, keepalives).
+SFTPPool opens several SFTP channels over one transport so independent file
+transfers can run concurrently instead of queueing behind each other on a
+single channel.
+fast_get and fetch_bytes download a file with bounded read-ahead, to disk or
+to memory.
+"""
+
+import io
+import queue
+import socket
+from contextlib import contextmanager
+from typing import Optional
+
+import paramiko
+
+# SSH flow-control window per channel; paramiko's ~2 MB default caps throughput
+# at window/RTT on high-latency links
+WINDOW_SIZE = 2 ** 27 - 1
+MAX_PACKET_SIZE = 32768
+# Kernel socket buffers sized for a high bandwidth-delay product
+SOCKET_BUFFER_SIZE = 32 * 1024 * 1024
+# Seconds between SSH keepalive packets on an idle transport
+KEEPALIVE_INTERVAL = 30
+# Outstanding read requests during prefetch; matches OpenSSH's sftp client.
+# paramiko's default is unbounded, which can stall the channel on large files
+PREFETCH_REQUESTS = 64
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def open_transport(hostname: str, username: str, pkey: paramiko.PKey, port: int = 22,
+                   timeout: int = 60, compress: bool = False,
+                   keepalive: int = KEEPALIVE_INTERVAL) -> paramiko.Transport:
+    """
+    Connect and authenticate an SSH transport tuned for bulk SFTP transfer.
+
+    The host key is not verified (equivalent to paramiko.AutoAddPolicy).
+    """
+    sock = socket.create_connection((hostname, port), timeout=timeout)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+
+        transport = paramiko.Transport(
+            sock,
+            default_window_size=WINDOW_SIZE,
+            default_max_packet_size=MAX_PACKET_SIZE,
+        )
+        # Avoid rekey pauses in the middle of large transfers
+        transport.packetizer.REKEY_BYTES = pow(2, 40)
+        transport.packetizer.REKEY_PACKETS = pow(2, 40)
+        transport.use_compression(compress)
+        transport.banner_timeout = timeout
+        transport.auth_timeout = timeout
+
+        transport.start_client(timeout=timeout)
+        transport.auth_publickey(username, pkey)
+        # SSH-level keepalives stop idle connections being dropped while the
+        # caller is busy converting
+        transport.set_keepalive(keepalive)
+        return transport
+    except Exception:
+        sock.close()
+        raise
+
+
+def _copy_remote(sftp: paramiko.SFTPClient, remote_path: str, dest, size: Optional[int] = None) -> int:
+    """Copy remote_path into the writable file object dest; returns the byte count."""
+    written = 0
+    with sftp.open(remote_path, 'rb') as remote_file:
+        # Don't wait for a status reply after each request on this handle
+        remote_file.set_pipelined(True)
+        if size is None:
+            size = remote_file.stat().st_size
+        remote_file.prefetch(size, max_concurrent_prefetch_requests=PREFETCH_REQUESTS)
+        while True:
+            data = remote_file.read(READ_CHUNK_SIZE)
+            if not data:
+                break
+            dest.write(data)
+            written += len(data)
+    return written
+
+
+def fast_get(sftp: paramiko.SFTPClient, remote_path: str, local_path: str, size: Optional[int] = None) -> int:
+    """
+    Download remote_path to local_path with bounded prefetch and 1 MiB reads.
+
+    Pass size when it is already known (e.g. from listdir_attr) to skip a stat.
+
+    Returns:
+        Number of bytes written
+    """
+    with open(local_path, 'wb') as local_file:
+        return _copy_remote(sftp, remote_path, local_file, size)
+
+
+def fetch_bytes(sftp: paramiko.SFTPClient, remote_path: str) -> io.BytesIO:
+    """Download remote_path into memory; the returned buffer is rewound to the start."""
+    buffer = io.BytesIO()
+    _copy_remote(sftp, remote_path, buffer)
+    buffer.seek(0)
+    return buffer
+
+
+class SFTPPool:
+    """Fixed-size pool of SFTP clients multiplexed over one paramiko Transport."""
+
+    def __init__(self, transport: paramiko.Transport, size: int = 4, channel_timeout: int = 300):
+        self.size = size
+        self.clients = queue.Queue()
+        for _ in range(size):
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            sftp.get_channel().settimeout(channel_timeout)
+            self.clients.put(sftp)
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a client for the duration of the with-block."""
+        sftp = self.clients.get()
+        if sftp is None:
+            # Pool was closed; pass the marker on to any other waiter
+            self.clients.put(None)
+            raise paramiko.SSHException("SFTP pool is closed")
+        try:
+            yield sftp
+        finally:
+            self.clients.put(sftp)
+
+    def close(self):
+        while not self.clients.empty():
+            try:
+                sftp = self.clients.get_nowait()
+                if sftp is not None:
+                    sftp.close()
+            except Exception:
+                pass
+        # Wake anyone waiting in acquire(); clients still borrowed are closed
+        # along with the transport
+        self.clients.put(None)